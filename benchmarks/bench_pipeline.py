@@ -0,0 +1,138 @@
+"""
+    Benchmark van de pipeline en de losse stappen tegen de nep-site uit fake_osm.py, zonder netwerk.
+    Geeft per stap de duur, het aantal WebDriver round-trips, de wachttijd en het aantal paginaladingen.
+
+    Uitvoeren vanuit de root van de repo (settings.py moet bestaan, settings.driver bepaalt de browser).
+    De browser start headless via main.maak_driver, tenzij settings.lichte_driver uit staat:
+        $ python benchmarks/bench_pipeline.py --herhaal 3
+"""
+import argparse
+import collections
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fake_osm  # noqa: E402
+import main  # noqa: E402
+import settings  # noqa: E402
+
+
+def begintoestand(pool):
+    """
+        Zet de nep-site terug in de begintoestand, zonder sessie in de browsers van de pool
+    """
+    urllib.request.urlopen(urllib.request.Request(main.BASE_URL + 'fake/toestand', method='DELETE')).close()
+    for browser in [pool.pak()] + pool.pak_hulp():
+        browser.naar_eigen_domein()
+        browser.execute_script('window.localStorage.clear();')
+        browser.delete_all_cookies()
+    for bestand in ['sessie.json', 'checkpoint.json', 'osm.sqlite', 'plan.json']:
+        pad = os.path.join(settings.directory, bestand)
+        if os.path.isfile(pad):
+            os.remove(pad)
+
+
+def pipeline(pool, metrics):
+    """
+        Draait de hele pipeline en geeft de doorlooptijd terug, en of de pipeline gelukt is. Met meer browsers in de
+        pool lopen stappen tegelijk, dan is de doorlooptijd korter dan de som van de stappen.
+    """
+    checkpoint = main.Checkpoint(os.path.join(settings.directory, 'checkpoint.json'))
+    opslag = main.maak_opslag(metrics.run)
+    start = time.time()
+    gelukt = main.run_script_within_try(None, pool, metrics, checkpoint, opslag)
+    if not gelukt:
+        print('Pipeline mislukt bij {}'.format(checkpoint.mislukt))
+    if opslag:
+        opslag.sluit()
+    return time.time() - start, gelukt
+
+
+def losse_stappen(pool, metrics):
+    browser = pool.pak()
+    browser.metrics = metrics
+    meet = metrics.stap
+    with meet('login'):
+        browser.login('bench', 'bench', None)
+        browser.data = main.OsmDataClient.van_browser(browser)
+    with meet('transfer_geld'):
+        browser.transfer_geld('af')
+    with meet('read_table'):
+        browser.go_to_url('Training')
+        browser.wait_on_class('knockout-loader-content')
+        browser.find_element_by_class_name('knockout-loader-content').find_element_by_class_name('btn').click()
+        browser.read_table()
+    with meet('get_spelers'):
+        browser.get_spelers()
+    with meet('train'):
+        browser.train(None, 1)
+    with meet('zet_specialist_goed'):
+        browser.zet_specialist_goed()
+    with meet('zet_hardheid_goed'):
+        browser.zet_hardheid_goed()
+    with meet('selecteer_sponsor'):
+        browser.selecteer_sponsor()
+    browser.metrics = None
+    browser.data = None
+
+
+def rapport(titel, metingen, doorlooptijden=None):
+    print('\n' + titel)
+    print('{:<22}{:>10}{:>8}{:>12}{:>9}{:>8}'.format('stap', 'duur (s)', 'calls', 'wachten (s)', 'paginas', 'fout'))
+    per_stap = collections.OrderedDict()
+    for metrics in metingen:
+        for record in metrics.stappen:
+            per_stap.setdefault(record['stap'], []).append(record)
+    totaal = 0.0
+    for stap, records in per_stap.items():
+        aantal = len(records)
+        duur = sum(record['duur'] for record in records) / aantal
+        totaal += duur
+        print('{:<22}{:>10.2f}{:>8.0f}{:>12.2f}{:>9.0f}{:>8}'.format(
+            stap, duur, sum(record['calls'] for record in records) / aantal,
+            sum(record['wachttijd'] for record in records) / aantal,
+            sum(len(record['paginas']) for record in records) / aantal,
+            sum(not record['gelukt'] for record in records)))
+    print('{:<22}{:>10.2f}'.format('som van de stappen', totaal))
+    if doorlooptijden:
+        print('{:<22}{:>10.2f}'.format('doorlooptijd', sum(doorlooptijden) / len(doorlooptijden)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--herhaal', type=int, default=1, help='aantal keer dat alles gemeten wordt')
+    parser.add_argument('--parallel', type=int, default=2, help='aantal browsers voor de pipeline')
+    args = parser.parse_args()
+
+    server, main.BASE_URL = fake_osm.start()
+    settings.api = {'base_url': main.BASE_URL + 'api/'}
+    settings.directory = tempfile.mkdtemp()
+    pool = main.DriverPool(parallel=args.parallel)
+    try:
+        volledig, doorlooptijden, los, mislukt = [], [], [], 0
+        for _ in range(args.herhaal):
+            begintoestand(pool)
+            metrics = main.Metrics()
+            doorlooptijd, gelukt = pipeline(pool, metrics)
+            doorlooptijden.append(doorlooptijd)
+            mislukt += not gelukt
+            volledig.append(metrics)
+
+            begintoestand(pool)
+            metrics = main.Metrics()
+            losse_stappen(pool, metrics)
+            los.append(metrics)
+        rapport('Volledige pipeline (run_script_within_try, {} browsers)'.format(args.parallel), volledig,
+                doorlooptijden)
+        rapport('Losse stappen', los)
+    finally:
+        pool.sluit()
+        server.shutdown()
+        shutil.rmtree(settings.directory)
+    if mislukt:
+        sys.exit('Pipeline {} van de {} keer mislukt'.format(mislukt, args.herhaal))
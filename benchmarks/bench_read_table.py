@@ -0,0 +1,58 @@
+"""
+    Micro-benchmark van het inlezen van de spelerstabel.
+    Vergelijkt de oude route (BeautifulSoup + pd.read_html) met main.parse_table op opgeslagen pagina's.
+
+    Uitvoeren vanuit de root van de repo (settings.py moet bestaan):
+        $ python benchmarks/bench_read_table.py
+"""
+import os
+import re
+import sys
+import timeit
+from io import StringIO
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from main import parse_table  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def read_table_oud(html):
+    """
+        De oude OsmDriver.read_table: de hele pagina parsen, de tabel weer naar tekst omzetten en opnieuw parsen
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    table = '<table>'
+    table = table + str(soup.find('thead'))
+    table = table + '<tbody>'
+    table = table + ''.join(str(soup.find_all('tr')))
+    table = table + '</tbody></table>'
+    res = pd.read_html(StringIO(table), header=0)[0]
+    return res.iloc[1:]
+
+
+def als_tekst(tabel):
+    # read_html maakt van kolommen zonder kop getallen, parse_table laat alles als tekst
+    def tekst(waarde):
+        return re.sub(r'\.0$', '', str(waarde)) if pd.notnull(waarde) else ''
+
+    return tabel.apply(lambda kolom: kolom.map(tekst))
+
+
+def benchmark(naam, html, aantal=50):
+    pd.testing.assert_frame_equal(als_tekst(read_table_oud(html)), als_tekst(parse_table(html)))
+    oud = min(timeit.repeat(lambda: read_table_oud(html), number=aantal, repeat=3)) / aantal
+    nieuw = min(timeit.repeat(lambda: parse_table(html), number=aantal, repeat=3)) / aantal
+    print('{:<20} oud: {:7.2f}ms  nieuw: {:7.2f}ms  {:5.1f}x sneller'.format(
+        naam, oud * 1000, nieuw * 1000, oud / nieuw))
+
+
+if __name__ == '__main__':
+    for bestand in sorted(os.listdir(FIXTURES)):
+        if bestand.endswith('.html'):
+            with open(os.path.join(FIXTURES, bestand)) as f:
+                benchmark(bestand, f.read())
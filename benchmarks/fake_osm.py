@@ -0,0 +1,128 @@
+"""
+    Lokale nep-versie van onlinesoccermanager.nl, zodat de pipeline zonder netwerk gemeten en getest kan worden.
+    Serveert de pagina's uit fixtures/site, met dezelfde selectors die OsmDriver gebruikt.
+    Het gedrag van de pagina's zit in fixtures/site/fake_osm.js. De toestand van de club staat op de server onder
+    /fake/toestand, zodat alle browsers dezelfde toestand zien. Een POST wijzigt de meegestuurde sleutels,
+    DELETE zet hem terug naar BEGINTOESTAND.
+    Onder /api/ staat een stub van de JSON api voor OsmDataClient: het laatste deel van het pad is het
+    bestand in fixtures/site/api, bijv. /api/v1.1/leagues/1/teams/1/players geeft players.json.
+
+    Los starten:
+        $ python benchmarks/fake_osm.py 8000
+    en dan in settings.py: base_url = 'http://localhost:8000/'
+"""
+import copy
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse
+
+SITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'site')
+
+# Pagina's die zonder ingelogde sessie bereikbaar zijn
+OPENBAAR = ['Login', 'Career']
+
+# Toestand van de club bij het starten: geld op de bank, een afgeronde training, een bonus en lege sponsorplekken
+BEGINTOESTAND = {
+    'bank': True,
+    'resultaat': True,
+    'toast': True,
+    'training': [None, None, 'Piet Jansen', None],
+    'stijl': 0,
+    'sponsors': [None, None],
+    'specialisten': [None, 'Piet Jansen', None, None],
+}
+
+
+class FakeOsmHandler(BaseHTTPRequestHandler):
+    def stuur(self, status, inhoud=b'', soort='text/html; charset=utf-8', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', soort)
+        self.send_header('Content-Length', str(len(inhoud)))
+        for naam, waarde in (headers or {}).items():
+            self.send_header(naam, waarde)
+        self.end_headers()
+        self.wfile.write(inhoud)
+
+    def do_GET(self):
+        pagina = urlparse(self.path).path.strip('/') or 'Login'
+        if pagina == 'favicon.ico':
+            self.stuur(200, soort='image/x-icon')
+            return
+        if pagina == 'fake_osm.js':
+            with open(os.path.join(SITE, pagina), 'rb') as bestand:
+                self.stuur(200, bestand.read(), 'application/javascript')
+            return
+
+        if pagina == 'fake/toestand':
+            self.stuur(200, json.dumps(self.server.toestand).encode(), 'application/json')
+            return
+
+        ingelogd = 'sessie=' in self.headers.get('Cookie', '')
+        if pagina.startswith('api/'):
+            pad = os.path.join(SITE, 'api', pagina.rsplit('/', 1)[-1] + '.json')
+            if not ingelogd:
+                self.stuur(401, b'{}', 'application/json')
+            elif not os.path.isfile(pad):
+                self.stuur(404, b'{}', 'application/json')
+            else:
+                with open(pad, 'rb') as bestand:
+                    self.stuur(200, bestand.read(), 'application/json')
+            return
+
+        headers = dict()
+        if pagina == 'Career':
+            # Het inlogformulier stuurt naar de carriere pagina, daar begint de sessie
+            headers['Set-Cookie'] = 'sessie=nep; Path=/'
+        elif pagina not in OPENBAAR and not ingelogd:
+            pagina = 'Login'
+
+        pad = os.path.join(SITE, pagina.replace('/', '_') + '.html')
+        if not os.path.isfile(pad):
+            self.stuur(404, b'Niet gevonden')
+            return
+        with open(pad, 'rb') as bestand:
+            self.stuur(200, bestand.read(), headers=headers)
+
+    def do_POST(self):
+        if urlparse(self.path).path.strip('/') != 'fake/toestand':
+            self.stuur(404, b'Niet gevonden')
+            return
+        # Een POST bevat alleen de gewijzigde sleutels
+        self.server.toestand.update(json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode()))
+        self.stuur(200, b'{}', 'application/json')
+
+    def do_DELETE(self):
+        self.server.toestand = copy.deepcopy(BEGINTOESTAND)
+        self.stuur(200, b'{}', 'application/json')
+
+    def log_message(self, format, *args):
+        # Geen log per request, dat verstoort de metingen
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server heeft deze pas vanaf Python 3.7
+    daemon_threads = True
+
+
+def start(poort=0):
+    """
+        Start de nep-site in een achtergrond thread. Geeft de server en de base url terug.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', poort), FakeOsmHandler)
+    server.toestand = copy.deepcopy(BEGINTOESTAND)
+    threading.Thread(target=server.serve_forever, name='fake_osm', daemon=True).start()
+    return server, 'http://127.0.0.1:{}/'.format(server.server_address[1])
+
+
+if __name__ == '__main__':
+    server, base_url = start(int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
+    print('Nep OSM draait op {}'.format(base_url))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,223 @@
+// Gedrag van de nep-site. De toestand staat op de server (fake_osm.py), zodat alle browsers dezelfde club zien.
+(function () {
+    var STIJLEN = ['Voorzichtig', 'Normaal', 'Agressief', 'Zeer agressief'];
+    var SPECIALISTEN = ['Aanvoerder', 'Penalty', 'Vrije trappen', 'Corners'];
+
+    function toestand() {
+        var verzoek = new XMLHttpRequest();
+        verzoek.open('GET', '/fake/toestand', false);
+        verzoek.send();
+        return JSON.parse(verzoek.responseText);
+    }
+
+    // Alleen de gewijzigde sleutel, zodat browsers die tegelijk iets anders wijzigen elkaar niet overschrijven
+    function bewaar(data, sleutel) {
+        var wijziging = {};
+        wijziging[sleutel] = data[sleutel];
+        var verzoek = new XMLHttpRequest();
+        verzoek.open('POST', '/fake/toestand', false);
+        verzoek.setRequestHeader('Content-Type', 'application/json');
+        verzoek.send(JSON.stringify(wijziging));
+    }
+
+    function klik(selector, functie) {
+        var elementen = document.querySelectorAll(selector);
+        for (var i = 0; i < elementen.length; i++) {
+            elementen[i].addEventListener('click', functie);
+        }
+    }
+
+    function toon(id, zichtbaar) {
+        document.getElementById(id).style.display = zichtbaar ? 'block' : 'none';
+    }
+
+    function algemeen(data) {
+        var nav = document.querySelector('.navbar');
+        if (!nav) {
+            return;
+        }
+        if (data.sponsors.indexOf(null) >= 0) {
+            var icoon = document.createElement('span');
+            icoon.className = 'icon-notification-sponsor';
+            nav.appendChild(icoon);
+        }
+        if (data.toast) {
+            var toast = document.createElement('div');
+            toast.className = 'toastContent';
+            toast.innerText = 'Bonus ontvangen: 100K';
+            toast.addEventListener('click', function () {
+                var data = toestand();
+                data.toast = false;
+                bewaar(data, 'toast');
+                toast.parentNode.removeChild(toast);
+            });
+            document.body.appendChild(toast);
+        }
+    }
+
+    function bank(data) {
+        var rente = document.querySelector("span[data-bind='currency: financePartial().interest']");
+        klik('#clubfunds-amount', function () {
+            rente.innerText = toestand().bank ? '12.500' : '0';
+            toon('bank', true);
+        });
+        klik('#overmaken', function () {
+            var data = toestand();
+            data.bank = !data.bank;
+            bewaar(data, 'bank');
+            rente.innerText = data.bank ? '12.500' : '0';
+        });
+    }
+
+    function training(data) {
+        var knoppen = document.querySelectorAll('.knockout-loader-content .btn');
+        var actief = null;
+        for (var i = 0; i < knoppen.length; i++) {
+            knoppen[i].innerText = data.training[i] ? 'Bezig: ' + data.training[i] + ' 01:59:30' : 'Trainen 250K';
+            (function (slot) {
+                knoppen[slot].addEventListener('click', function () {
+                    if (!toestand().training[slot]) {
+                        actief = slot;
+                        toon('spelerkeuze', true);
+                    }
+                });
+            })(i);
+        }
+        if (!data.resultaat) {
+            var resultaat = document.querySelector('.btn-show-result');
+            resultaat.parentNode.removeChild(resultaat);
+        }
+        klik('.btn-show-result', function () {
+            var data = toestand();
+            data.resultaat = false;
+            bewaar(data, 'resultaat');
+        });
+        klik('#spelerkeuze tr.clickable', function () {
+            var naam = this.querySelector('.td-player-name').innerText.replace(/ \(\d+\)$/, '');
+            var data = toestand();
+            if (data.training.indexOf(naam) >= 0) {
+                // Speler is al aan het trainen: melding met een sluitknop
+                var melding = document.createElement('div');
+                melding.className = 'modal-v2';
+                melding.innerHTML = '<p>Deze speler traint al</p><span class="close">x</span>';
+                melding.querySelector('.close').addEventListener('click', function () {
+                    melding.parentNode.removeChild(melding);
+                });
+                document.body.insertBefore(melding, document.body.firstChild);
+                return;
+            }
+            data.training[actief] = naam;
+            bewaar(data, 'training');
+            knoppen[actief].innerText = 'Bezig: ' + naam + ' 02:00:00';
+            toon('spelerkeuze', false);
+        });
+    }
+
+    function tactiek(data) {
+        var label = document.querySelector('#carousel-tacticstyleofplay .carousel-label');
+        label.innerText = STIJLEN[data.stijl];
+        function draai(stap) {
+            var data = toestand();
+            data.stijl = (data.stijl + stap + STIJLEN.length) % STIJLEN.length;
+            bewaar(data, 'stijl');
+            label.innerText = STIJLEN[data.stijl];
+        }
+        klik('#carousel-tacticstyleofplay .button-arrow-right', function () { draai(1); });
+        klik('#carousel-tacticstyleofplay .button-arrow-left', function () { draai(-1); });
+    }
+
+    function sponsors(data) {
+        var slots = document.getElementById('slots');
+        var lijst = document.getElementById('aanbiedingen');
+        function teken() {
+            var data = toestand();
+            slots.innerHTML = '';
+            for (var i = 0; i < data.sponsors.length; i++) {
+                var slot = document.createElement('div');
+                if (data.sponsors[i]) {
+                    slot.className = 'contract-container';
+                    slot.innerText = data.sponsors[i];
+                } else {
+                    slot.className = 'no-contract-container';
+                    slot.innerText = 'Kies een sponsor';
+                    slot.addEventListener('click', function () { toon('choosesponsor', true); });
+                }
+                slots.appendChild(slot);
+            }
+        }
+        teken();
+        // De volgorde in de DOM blijft gelijk, alleen het huidige aanbod heeft de class active en is zichtbaar
+        var aanbiedingen = lijst.querySelectorAll('.offer');
+        var actief = 0;
+        function draai(stap) {
+            actief = (actief + stap + aanbiedingen.length) % aanbiedingen.length;
+            for (var i = 0; i < aanbiedingen.length; i++) {
+                aanbiedingen[i].className = i === actief ? 'offer active' : 'offer';
+                aanbiedingen[i].style.display = i === actief ? 'block' : 'none';
+            }
+        }
+        draai(0);
+        klik('.carousel-next', function () { draai(1); });
+        klik('.carousel-prev', function () { draai(-1); });
+        klik('#bevestig', function () {
+            var data = toestand();
+            var aanbod = aanbiedingen[actief].innerText.split('\n');
+            data.sponsors[data.sponsors.indexOf(null)] = aanbod[0] + ' ' + aanbod[3];
+            bewaar(data, 'sponsors');
+            toon('choosesponsor', false);
+            teken();
+        });
+    }
+
+    function specialisten(data) {
+        var slides = document.querySelectorAll('.slidee > li');
+        var actief = 0;
+        function teken() {
+            var data = toestand();
+            for (var i = 0; i < slides.length; i++) {
+                slides[i].className = i === actief ? 'slide active' : 'slide';
+                var naam = data.specialisten[i];
+                slides[i].innerHTML = '<h3>' + SPECIALISTEN[i] + '</h3>' + (naam ?
+                    '<div class="specialist-name">' + naam + '</div><a class="change-player-link">Wijzig</a>' :
+                    '<div>Kies speler</div>');
+            }
+        }
+        teken();
+        document.querySelector('.slidee').addEventListener('click', function (event) {
+            if (event.target.className === 'change-player-link' || event.target.innerText === 'Kies speler') {
+                toon('spelerkeuze', true);
+            }
+        });
+        klik('.slider-next', function () { actief = Math.min(actief + 1, slides.length - 1); teken(); });
+        klik('.slider-prev', function () { actief = Math.max(actief - 1, 0); teken(); });
+        klik('#spelerkeuze .td-player-name', function () {
+            var data = toestand();
+            data.specialisten[actief] = this.innerText;
+            bewaar(data, 'specialisten');
+            toon('spelerkeuze', false);
+            teken();
+        });
+    }
+
+    // De api van OsmDataClient vindt de competitie en het team in localStorage
+    window.localStorage.setItem('leagueId', '1');
+    window.localStorage.setItem('teamId', '1');
+
+    var data = toestand();
+    algemeen(data);
+    if (document.getElementById('clubfunds-amount')) {
+        bank(data);
+    }
+    if (document.querySelector('.knockout-loader-content .btn')) {
+        training(data);
+    }
+    if (document.getElementById('carousel-tacticstyleofplay')) {
+        tactiek(data);
+    }
+    if (document.getElementById('choosesponsor')) {
+        sponsors(data);
+    }
+    if (document.querySelector('.slidee')) {
+        specialisten(data);
+    }
+})();
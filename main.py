@@ -1,21 +1,210 @@
+import asyncio
+import atexit
+import collections
+import contextlib
 import copy
 import datetime
+import json
 import logging
+import multiprocessing
+import os
+import queue
 import re
+import select
+import sqlite3
 import sys
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+import lxml.html
 import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
-from selenium.common.exceptions import TimeoutException
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.command import Command
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.support.ui import WebDriverWait
 from slackclient import SlackClient
 
 import settings
 
+# Adres van OSM. Met settings.base_url kan bijv. de nep-site uit benchmarks/fake_osm.py gebruikt worden.
+BASE_URL = getattr(settings, 'base_url', 'http://www.onlinesoccermanager.nl/')
+
+# Loggers, worden in __main__ gekoppeld aan bestanden. Zo kan main ook geimporteerd worden (bijv. in de benchmarks).
+info_logger = logging.getLogger('info')
+error_logger = logging.getLogger('error')
+# Wordt in __main__ gezet als Slack is ingesteld
+slack_client = None
+# In de multi-account modus: het account van dit proces, en of het de Slack uit settings deelt met de andere accounts
+account_naam = None
+slack_gedeeld = False
+
+# Standaard timeouts (in seconden) per stap. Te overschrijven met settings.wait_timeouts
+WAIT_TIMEOUTS = {
+    'default': 10,
+    'login': 20,
+    'sessie': 5,
+    'transfer_geld': 10,
+    'train': 10,
+    'specialist': 10,
+    'hardheid': 10,
+    'bonus': 5,
+    'sponsor': 10,
+}
+
+# Kolommen met spelerseigenschappen die als getal gelezen worden
+INT_KOLOMMEN = ['Aan', 'Ver', 'Lft']
+
+# Score per specialist, in de volgorde van de slides: aanvoerder, penalty, vrije trappen en corners
+SPECIALISTEN = [
+    ('aanvoerder', lambda spelers: spelers['Ver'] / 2 + spelers['Lft']),
+    ('penalty', lambda spelers: spelers['Aan'] / 2 + spelers['Lft']),
+    ('vrij', lambda spelers: spelers['Aan']),
+    ('corner', lambda spelers: spelers['Aan'] + spelers['Ver'] / 5),
+]
+
+# Zelfde whitespace opschoning als pd.read_html
+WHITESPACE = re.compile(r'[\r\n]+|\s{2,}')
+# Resterende tijd van een training aan het eind van de knop, bijv. 01:59:30 of 12:05
+TIMER = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{2})\s*$')
+
+# Profiel van de lichte browser. Te overschrijven met settings.driver_opties.
+DRIVER_OPTIES = {
+    'window_size': (1366, 768),
+    'cache_mb': 50,
+    # Extra command line flags voor de browser
+    'flags': [],
+    # Afbeeldingen, media en fonts worden niet geladen
+    'geblokkeerde_urls': ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.mp4', '*.webm',
+                          '*.mp3', '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    # Advertenties en trackers
+    'geblokkeerde_hosts': ['google-analytics.com', 'googletagmanager.com', 'doubleclick.net',
+                           'googlesyndication.com', 'adservice.google.com', 'facebook.net', 'connect.facebook.net',
+                           'scorecardresearch.com', 'hotjar.com', 'adnxs.com', 'criteo.com'],
+}
+
+# PhantomJS kan zelf alleen afbeeldingen blokkeren. Dit script draait in PhantomJS zelf, this is de page,
+# en breekt de requests naar geblokkeerde_urls (globs zoals *.woff) en geblokkeerde_hosts af.
+PHANTOM_BLOKKEER_SCRIPT = r"""
+    var patronen = arguments[0].map(function (glob) {
+        return new RegExp('^' + glob.replace(/[.+?^${}()|[\]\\]/g, '\\$&').replace(/\*/g, '.*') + '$', 'i');
+    });
+    var hosts = arguments[1];
+    this.onResourceRequested = function (verzoek, netwerk) {
+        var url = verzoek.url.split(/[?#]/)[0];
+        var host = (url.match(/^[a-z]+:\/\/([^\/:]+)/i) || [])[1] || '';
+        var geblokkeerd = patronen.some(function (patroon) { return patroon.test(url); }) ||
+            hosts.some(function (blok) { return host === blok || host.slice(-blok.length - 1) === '.' + blok; });
+        if (geblokkeerd) {
+            netwerk.abort();
+        }
+    };
+"""
+
+# JSON api die de knockout frontend zelf gebruikt. Te overschrijven met settings.api, bijv. {'aan': False}.
+API = {
+    'aan': True,
+    'base_url': 'https://web-api.onlinesoccermanager.com/api/',
+    # Sleutels in localStorage met de competitie, het team en het toegangstoken van de ingelogde sessie
+    'league_sleutel': 'leagueId',
+    'team_sleutel': 'teamId',
+    'token_sleutel': 'access_token',
+    'spelers': 'v1.1/leagues/{league}/teams/{team}/players',
+    'wedstrijd': 'v1/leagues/{league}/teams/{team}/fixtures/next',
+    'financien': 'v1/leagues/{league}/teams/{team}/finances',
+    'sponsors': 'v1/leagues/{league}/teams/{team}/sponsors/offers',
+}
+
+# Het plannen van de runs. Te overschrijven met settings.planner.
+PLANNER_OPTIES = {
+    # Plan de volgende runs op de timers van de trainingen, de aftrap en de rente. Uit: elke 8 uur alles.
+    'adaptief': True,
+    # Seconden na het aflopen van een timer, zodat de training zeker klaar is
+    'marge': 60,
+    # Trainingen die binnen zoveel seconden na elkaar klaar zijn, worden in een run afgerond
+    'samenvoegen': 900,
+    # Seconden voor de aftrap dat specialisten en speelstijl nog een keer gecontroleerd worden
+    'voor_aftrap': 1800,
+}
+
+# Een element uit de snapshot van de pagina: de referentie om op te klikken, de tekst en de class
+PaginaElement = collections.namedtuple('PaginaElement', ['element', 'tekst', 'klasse'])
+
+# Per selector alle elementen met hun tekst en class, voor OsmDriver.snapshot.
+# Een selector (container, selector) zoekt alleen binnen de eerste container.
+SNAPSHOT_SCRIPT = """
+    return Array.prototype.map.call(arguments[0], function (selector) {
+        var bron = document;
+        if (Array.isArray(selector)) {
+            bron = document.querySelector(selector[0]);
+            selector = selector[1];
+        }
+        if (!bron) {
+            return [];
+        }
+        return Array.prototype.map.call(bron.querySelectorAll(selector), function (element) {
+            return [element, (element.innerText || '').trim(), element.getAttribute('class') || ''];
+        });
+    });
+"""
+
+# De teksten van alle aanbiedingen in de sponsor carrousel, in de volgorde van de pagina, en de index van het aanbod
+# dat nu getoond wordt: het aanbod dat zelf of via zijn ouder de class active heeft, anders het aanbod dat echt
+# zichtbaar is. -1 als er geen aanbod getoond wordt.
+SPONSOR_SCRIPT = """
+    var aanbiedingen = document.getElementsByClassName('choosesponsor-top');
+    var teksten = [], actief = -1, zichtbaar = -1;
+    for (var i = 0; i < aanbiedingen.length; i++) {
+        var aanbod = aanbiedingen[i];
+        var getoond = aanbod.offsetParent !== null;
+        // Een verborgen aanbod heeft geen innerText met regels, dan de regels uit de kinderen
+        teksten.push(getoond ? aanbod.innerText : Array.prototype.map.call(aanbod.children, function (regel) {
+            return regel.textContent.trim();
+        }).join('\\n'));
+        var klassen = ' ' + aanbod.className + ' ' + (aanbod.parentElement ? aanbod.parentElement.className : '') + ' ';
+        if (actief < 0 && klassen.indexOf(' active ') >= 0) {
+            actief = i;
+        }
+        if (getoond && zichtbaar < 0) {
+            var vak = aanbod.getBoundingClientRect();
+            var punt = document.elementFromPoint(vak.left + vak.width / 2, vak.top + vak.height / 2);
+            if (punt && aanbod.contains(punt)) {
+                zichtbaar = i;
+            }
+        }
+    }
+    return [teksten, actief >= 0 ? actief : zichtbaar];
+"""
+
+# De knoppen van de trainingsslots, alleen in de eerste knockout-loader-content
+TRAINING_KNOPPEN = ('.knockout-loader-content', '.btn')
+
+# WebDriver commando's die de pagina kunnen veranderen. Daarna is de snapshot van de pagina niet meer geldig.
+MUTERENDE_COMMANDS = {
+    Command.GET, Command.REFRESH, Command.GO_BACK, Command.GO_FORWARD,
+    Command.CLICK_ELEMENT, Command.SEND_KEYS_TO_ELEMENT, Command.SUBMIT_ELEMENT, Command.CLEAR_ELEMENT,
+    Command.EXECUTE_SCRIPT, Command.W3C_EXECUTE_SCRIPT, Command.EXECUTE_ASYNC_SCRIPT, Command.W3C_EXECUTE_SCRIPT_ASYNC,
+}
+
+# Alle sleutels van localStorage als object. ES5, zodat het ook in PhantomJS werkt.
+LOCAL_STORAGE_SCRIPT = """
+    var data = {};
+    for (var i = 0; i < window.localStorage.length; i++) {
+        var sleutel = window.localStorage.key(i);
+        data[sleutel] = window.localStorage.getItem(sleutel);
+    }
+    return data;
+"""
+
+# Selector van de knockout loader die over de pagina ligt zolang er data geladen wordt
+LOADER_SELECTOR = '.knockout-loader:not(.knockout-loader-content), .loading-spinner'
+
 
 def handle_direct_command(command, slack_client, run_time):
     """
@@ -53,12 +242,29 @@ def parse_messages(slack_events, run_time):
     """
     for event in slack_events:
         if event['type'] == 'message' and 'subtype' not in event:
-            result = handle_direct_command(event['text'], slack_client, run_time)
+            command = voor_dit_account(event['text'])
+            if command is None:
+                return None
+            result = handle_direct_command(command, slack_client, run_time)
             return result
         else:
             return None
 
 
+def voor_dit_account(message_text):
+    """
+        Geeft het commando als het bericht voor dit proces is, anders None. In de multi-account modus gaat een
+        commando naar een account door de naam ervoor te zetten, bijv. 'club2 run'. Een account dat de Slack van
+        een ander deelt, reageert alleen op commando's met zijn naam.
+    """
+    if account_naam is None:
+        return message_text
+    naam, _, command = message_text.strip().partition(' ')
+    if naam == account_naam:
+        return command.strip()
+    return None if slack_gedeeld else message_text
+
+
 def parse_direct_mention(message_text):
     """
         Returns the userid of the user the message was directed to and returns the message itself without the mention.
@@ -69,11 +275,86 @@ def parse_direct_mention(message_text):
     return (matches.group(1), matches.group(2).strip()) if matches else (None, None)
 
 
+def parse_table(html):
+    """
+        Leest de spelerstabel in een enkele lxml pass uit de html van de pagina.
+        Geeft hetzelfde DataFrame terug als de oude route via BeautifulSoup en pd.read_html:
+        de kolommen uit de eerste thead, alle rijen behalve de eerste en de index vanaf 1.
+    """
+    doc = lxml.html.fromstring(html)
+
+    def tekst(cel):
+        waarde = WHITESPACE.sub(' ', cel.text_content()).strip()
+        return waarde if waarde else np.nan
+
+    thead = doc.find('.//thead')
+    header_rij = thead.find('.//tr') if thead is not None else None
+    header = [tekst(cel) for cel in header_rij.xpath('./th|./td')] if header_rij is not None else []
+    data = [[tekst(cel) for cel in rij.xpath('./th|./td')] for rij in doc.iter('tr')][1:]
+
+    breedte = max([len(header)] + [len(rij) for rij in data])
+    kolommen = []
+    for i in range(breedte):
+        naam = header[i] if i < len(header) and isinstance(header[i], str) else 'Unnamed: {}'.format(i)
+        # Dubbele namen krijgen net als bij pandas een volgnummer
+        dubbel = kolommen.count(naam)
+        kolommen.append('{}.{}'.format(naam, dubbel) if dubbel else naam)
+    data = [rij + [np.nan] * (breedte - len(rij)) for rij in data]
+    return pd.DataFrame(data, columns=kolommen, index=range(1, len(data) + 1))
+
+
+def specialisten_overzicht(tabel):
+    """
+        Maakt van de tabel uit de spelerskeuze bij de specialisten een overzicht met alleen spelers.
+        De eerste cel van elke rij is de positie, waardoor de kolomnamen een plek opschuiven.
+    """
+    tabel = tabel.copy()
+    tabel.columns = np.append('positie', tabel.columns.values[:-1])
+    tabel = tabel[~tabel['positie'].isin(['Aanvallers', 'Middenvelders', 'Verdedigers', 'Keepers'])]
+    return maak_int(tabel, INT_KOLOMMEN)
+
+
+def kies_specialisten(overzicht):
+    """
+        Berekent voor alle specialisten tegelijk de score en kiest per specialist de beste speler.
+        Een speler wordt maar voor een specialist gekozen, in de volgorde van SPECIALISTEN.
+    """
+    scores = pd.DataFrame({naam: score(overzicht) for naam, score in SPECIALISTEN}, index=overzicht.index)
+    vrij = pd.Series(True, index=overzicht.index)
+    gekozen = []
+    for naam, score in SPECIALISTEN:
+        beste = scores.loc[vrij, naam].idxmax()
+        vrij[beste] = False
+        gekozen.append(overzicht.loc[beste, 'Aanvallers'])
+    return gekozen
+
+
+def parse_sponsor_prijs(tekst):
+    """
+        Haalt de prijs uit de tekst van een sponsor aanbieding. De vierde regel is de prijs, bijv. '450K'.
+    """
+    return int(tekst.split('\n')[3][:-1])
+
+
+def maak_int(tabel, kolommen):
+    """
+        Zet de gegeven kolommen om naar gehele getallen. Lege of onleesbare waarden worden 0.
+    """
+    tabel = tabel.copy()
+    for kolom in kolommen:
+        tabel[kolom] = pd.to_numeric(tabel[kolom], errors='coerce').fillna(0).astype(int)
+    return tabel
+
+
 def post_to_slack(slack_client, message):
     """
         Posts a message to a slack channel using the global slack_client
     """
-    if slack_client:
+    if account_naam is not None:
+        message = '[{}] {}'.format(account_naam, message)
+    if isinstance(slack_client, SlackNotifier):
+        slack_client.post(message)
+    elif slack_client:
         slack_client.api_call(
             'chat.postMessage',
             10,
@@ -84,11 +365,166 @@ def post_to_slack(slack_client, message):
         )
 
 
+def parse_resterend(tekst):
+    """
+        Geeft de resterende tijd op de knop van een training in seconden, of None als er geen tijd op staat
+    """
+    gevonden = TIMER.search(tekst)
+    if not gevonden:
+        return None
+    uren, minuten, seconden = gevonden.groups()
+    return int(uren or 0) * 3600 + int(minuten) * 60 + int(seconden)
+
+
+def maak_plan(timers, aftrap=None, rente_vrij=None, nu=None):
+    """
+        Maakt de momenten voor de volgende runs, elk met alleen de stappen die dan nodig zijn:
+        het afronden en opnieuw vullen van de trainingen als de timers aflopen, een controle van specialisten en
+        speelstijl voor de aftrap, en het wegzetten van het geld als de rente vrijkomt.
+        timers is per slot de resterende tijd in seconden, 0 voor een vrij slot en None als die onbekend is.
+    """
+    opties = dict(PLANNER_OPTIES, **getattr(settings, 'planner', {}))
+    nu = nu or datetime.datetime.now()
+    momenten = []
+
+    bezig = sorted((resterend, slot) for slot, resterend in enumerate(timers) if resterend)
+    groepen = []
+    for resterend, slot in bezig:
+        if groepen and resterend - groepen[-1][0][0] <= opties['samenvoegen']:
+            groepen[-1].append((resterend, slot))
+        else:
+            groepen.append([(resterend, slot)])
+    for groep in groepen:
+        # Op het moment dat de laatste training van de groep klaar is
+        momenten.append({
+            'tijd': nu + datetime.timedelta(seconds=groep[-1][0] + opties['marge']),
+            'stappen': ['transfer_geld_af', 'rond_training_af'] + ['train_{}'.format(slot) for _, slot in groep] +
+                       ['transfer_geld_op'],
+            'reden': 'training',
+        })
+
+    if aftrap and aftrap - datetime.timedelta(seconds=opties['voor_aftrap']) > nu:
+        momenten.append({'tijd': aftrap - datetime.timedelta(seconds=opties['voor_aftrap']),
+                         'stappen': ['zet_specialist_goed', 'zet_hardheid_goed'], 'reden': 'aftrap'})
+    if rente_vrij and rente_vrij > nu:
+        momenten.append({'tijd': rente_vrij + datetime.timedelta(seconds=opties['marge']),
+                         'stappen': ['transfer_geld_op'], 'reden': 'rente'})
+    return sorted(momenten, key=lambda moment: moment['tijd'])
+
+
+def vat_samen(berichten, overgeslagen=0):
+    """
+        Voegt berichten samen tot een bericht. Gelijke berichten worden geteld, bijv. 'Speler getraind (3x)'.
+    """
+    tellingen = collections.OrderedDict()
+    for bericht in berichten:
+        tellingen[bericht] = tellingen.get(bericht, 0) + 1
+    regels = [bericht if aantal == 1 else '{} ({}x)'.format(bericht, aantal) for bericht, aantal in tellingen.items()]
+    if overgeslagen:
+        regels.append('{} berichten overgeslagen'.format(overgeslagen))
+    return '\n'.join(regels)
+
+
+class SlackNotifier:
+    """
+        Verstuurt berichten naar Slack vanuit een achtergrond thread.
+        Berichten die binnen het venster na elkaar komen worden samen in een bericht verstuurd.
+        Is de wachtrij vol, dan worden berichten overgeslagen en alleen geteld.
+        Alle andere attributen (rtm_read, server, ...) komen van de onderliggende SlackClient.
+    """
+
+    def __init__(self, client, venster=2, max_wachtrij=100, pogingen=3):
+        self.client = client
+        self.venster = venster
+        self.pogingen = pogingen
+        self.wachtrij = queue.Queue(max_wachtrij)
+        # Het aantal overgeslagen berichten wordt door de posters opgehoogd en door de thread uitgelezen
+        self.overgeslagen = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.verwerk, name='slack', daemon=True)
+        self.thread.start()
+
+    def __getattr__(self, naam):
+        return getattr(self.client, naam)
+
+    def post(self, message):
+        try:
+            self.wachtrij.put_nowait(message)
+        except queue.Full:
+            with self.lock:
+                self.overgeslagen += 1
+
+    def verwerk(self):
+        stoppen = False
+        while not stoppen:
+            berichten = [self.wachtrij.get()]
+            einde = time.time() + self.venster
+            while berichten[-1] is not None and time.time() < einde:
+                try:
+                    berichten.append(self.wachtrij.get(timeout=einde - time.time()))
+                except queue.Empty:
+                    break
+            if berichten[-1] is None:
+                # sluit() is aangeroepen: nog versturen wat er is en dan stoppen
+                stoppen = True
+                berichten = berichten[:-1]
+            with self.lock:
+                overgeslagen, self.overgeslagen = self.overgeslagen, 0
+            if berichten or overgeslagen:
+                self.verstuur(vat_samen(berichten, overgeslagen))
+
+    def verstuur(self, message):
+        for poging in range(self.pogingen):
+            try:
+                antwoord = self.client.api_call(
+                    'chat.postMessage',
+                    10,
+                    text=message,
+                    type="message",
+                    subtype="bot_message",
+                    channel=settings.slack['channel']
+                )
+                if not isinstance(antwoord, dict) or antwoord.get('ok', True):
+                    return True
+            except Exception:
+                pass
+            # Exponentiele backoff tussen de pogingen: 1, 2, 4, ... seconden
+            if poging < self.pogingen - 1:
+                time.sleep(2 ** poging)
+        error_logger.error('Slack bericht niet verstuurd: {}'.format(message))
+        return False
+
+    def sluit(self, timeout=30):
+        self.wachtrij.put(None)
+        self.thread.join(timeout)
+
+
 class OsmDriver(settings.driver):
+    # Metrics van de run die nu loopt. Als klasse attribuut omdat de driver al calls doet tijdens __init__.
+    metrics = None
+    # OsmDataClient voor het lezen van data zonder de pagina, of None
+    data = None
+    # Opslag met de toestand van vorige runs, of None
+    opslag = None
+    # Naam van de laatste stap die in deze poging op deze browser gelukt is, None na een fout of een nieuwe poging
+    vorige_stap = None
+    # Snapshot van de pagina en de html, tot de volgende klik, script of navigatie
+    _pagina = None
+    _html = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Geen impliciete wait: elke lookup die leeg terugkomt zou die tijd kosten. Er wordt expliciet gewacht.
+        self.implicitly_wait(0)
+        # Lijst van (stap, omschrijving, duur, gelukt) van alle waits in deze sessie
+        self.wacht_tijden = []
+        # Index van de spelerstabel, geldig tot de volgende paginalading
+        self._speler_index = None
+
     def login(self, username, password, slack_client):
-        self.implicitly_wait(5)
         # Log in
-        self.get("http://www.onlinesoccermanager.nl/Login")
+        self.go_to_url('Login')
+        self.wait_on_xpath("//*[@id='manager-name']", 'login')
         username_element = self.find_element_by_id("manager-name")
         password_element = self.find_element_by_id("password")
         username_element.send_keys(username)
@@ -96,10 +532,10 @@ class OsmDriver(settings.driver):
         login_attempt = self.find_element_by_xpath("//*[@type='submit']")
         login_attempt.submit()
         info_logger.info('ingelogd')
-        time.sleep(5)
 
         # Wacht tot hij geladen is
-        self.wait_on_class('active')
+        self.wait_on_class('active', 'login')
+        self.wait_on_loader('login')
 
         # Ga naar actieve competitie
         active_competition = self.find_element_by_class_name('active')
@@ -109,106 +545,373 @@ class OsmDriver(settings.driver):
         active_competition.click()
         info_logger.info('actieve competitie gekozen')
 
-    def wait_on_class(self, class_name):
-        delay = 5  # seconds
+    def sessie(self):
+        """
+            Geeft de cookies en local storage van de ingelogde sessie terug
+        """
+        return {
+            'cookies': self.get_cookies(),
+            'local_storage': self.execute_script(LOCAL_STORAGE_SCRIPT),
+        }
+
+    def bewaar_sessie(self, pad):
+        """
+            Slaat de cookies en local storage van de ingelogde sessie op, zodat een volgende run niet opnieuw hoeft in te loggen
+        """
+        sessie = self.sessie()
+        # Het bestand bevat inloggegevens, dus alleen leesbaar voor de eigenaar
+        with os.fdopen(os.open(pad, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as bestand:
+            json.dump(sessie, bestand)
+        info_logger.info('sessie opgeslagen')
+
+    def controleer_sessie(self):
+        """
+            Controleert met een enkele pagina of de browser nog ingelogd is
+        """
+        self.go_to_url('ControlCentre')
+        return self.wait_on_xpath("//div[@id='clubfunds-amount']", 'sessie')
+
+    def herstel_sessie(self, pad):
+        """
+            Zet een opgeslagen sessie terug en controleert met een enkele pagina of die nog geldig is.
+            Geeft False terug als er opnieuw ingelogd moet worden.
+        """
+        if not os.path.isfile(pad):
+            return False
         try:
-            WebDriverWait(self, delay).until(ec.presence_of_element_located((By.CLASS_NAME, class_name)))
-            success = True
-        except TimeoutException:
-            success = False
-        return success
+            with open(pad) as bestand:
+                sessie = json.load(bestand)
+        except ValueError:
+            os.remove(pad)
+            return False
+
+        self.zet_sessie(sessie)
+        geldig = self.controleer_sessie()
+        if geldig:
+            info_logger.info('sessie hersteld')
+        else:
+            info_logger.info('opgeslagen sessie verlopen')
+            self.delete_all_cookies()
+            os.remove(pad)
+        return geldig
 
-    def wait_on_xpath(self, xpath):
-        delay = 3  # seconds
+    def naar_eigen_domein(self):
+        """
+            Opent de goedkoopste pagina op het domein van OSM, het favicon. Een browser die daar geen localStorage
+            heeft (PhantomJS), gaat naar de loginpagina.
+        """
+        self.go_to_url('favicon.ico')
+        if not self.execute_script('try { return !!window.localStorage; } catch (e) { return false; }'):
+            self.go_to_url('Login')
+
+    def zet_sessie(self, sessie):
+        """
+            Zet de cookies en local storage van een sessie in deze browser, zonder te controleren of die geldig is
+        """
+        # Cookies kunnen alleen gezet worden op het eigen domein
+        self.naar_eigen_domein()
+        for cookie in sessie['cookies']:
+            cookie = {key: value for key, value in cookie.items()
+                      if key in ['name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry']}
+            if 'expiry' in cookie:
+                cookie['expiry'] = int(cookie['expiry'])
+            self.add_cookie(cookie)
+        self.execute_script(
+            'var data = arguments[0]; for (var key in data) { window.localStorage.setItem(key, data[key]); }',
+            sessie['local_storage'])
+
+    def timeout(self, stap):
+        timeouts = dict(WAIT_TIMEOUTS, **getattr(settings, 'wait_timeouts', {}))
+        return timeouts.get(stap, timeouts['default'])
+
+    def wacht(self, conditie, omschrijving, stap='default'):
+        """
+            Wacht tot de conditie waar is, met de timeout van de stap.
+            Slaat op hoe lang er daadwerkelijk gewacht is.
+        """
+        def actueel(driver):
+            # Elke controle kijkt naar de pagina zoals die nu is
+            self.vergeet_pagina()
+            return conditie(driver)
+
+        start = time.time()
         try:
-            WebDriverWait(self, delay).until(ec.presence_of_element_located((By.XPATH, xpath)))
+            WebDriverWait(self, self.timeout(stap), poll_frequency=0.1,
+                          ignored_exceptions=[StaleElementReferenceException]).until(actueel)
             success = True
         except TimeoutException:
             success = False
+        duur = time.time() - start
+        self.wacht_tijden.append((stap, omschrijving, duur, success))
+        if self.metrics:
+            self.metrics.wacht(duur, success)
+        if not success:
+            info_logger.info('wachten op {} ({}) duurde te lang: {:.2f}s'.format(omschrijving, stap, duur))
         return success
 
+    def wait_on_class(self, class_name, stap='default'):
+        return self.wacht(ec.presence_of_element_located((By.CLASS_NAME, class_name)),
+                          'class {}'.format(class_name), stap)
+
+    def wait_on_xpath(self, xpath, stap='default'):
+        return self.wacht(ec.presence_of_element_located((By.XPATH, xpath)), 'xpath {}'.format(xpath), stap)
+
+    def wait_on_text_change(self, element, oude_tekst, stap='default', of_selector=None):
+        """
+            Wacht tot de tekst van het element verandert, of tot er een element met of_selector op de pagina staat
+        """
+        def veranderd(driver):
+            if of_selector and driver.zoek(of_selector):
+                return True
+            return element.text != oude_tekst
+
+        return self.wacht(veranderd, 'tekstwijziging', stap)
+
+    def wait_until_gone(self, element, stap='default'):
+        def weg(driver):
+            try:
+                return not element.is_displayed()
+            except StaleElementReferenceException:
+                # Element is uit de DOM gehaald
+                return True
+
+        return self.wacht(weg, 'element weg', stap)
+
+    def wait_on_loader(self, stap='default'):
+        """
+            Wacht tot alle knockout loaders van de pagina verdwenen zijn
+        """
+        script = """
+            var loaders = document.querySelectorAll(arguments[0]);
+            for (var i = 0; i < loaders.length; i++) {
+                if (loaders[i].offsetParent !== null) { return false; }
+            }
+            return document.readyState === 'complete';
+        """
+        return self.wacht(lambda driver: driver.execute_script(script, LOADER_SELECTOR), 'loader', stap)
+
+    def wait_on_network_idle(self, stap='default'):
+        """
+            Wacht tot er geen ajax requests meer lopen en er sinds de vorige poll geen nieuwe resources zijn geladen
+        """
+        script = """
+            var actief = window.jQuery ? window.jQuery.active : 0;
+            return [document.readyState === 'complete' && actief === 0,
+                    window.performance && performance.getEntriesByType ?
+                        performance.getEntriesByType('resource').length : 0];
+        """
+        vorige = {'aantal': -1}
+
+        def idle(driver):
+            klaar, aantal = driver.execute_script(script)
+            stil = klaar and aantal == vorige['aantal']
+            vorige['aantal'] = aantal
+            return stil
+
+        return self.wacht(idle, 'netwerk', stap)
+
+    def wacht_rapport(self):
+        """
+            Geeft per stap het aantal waits en de totale wachttijd terug
+        """
+        rapport = dict()
+        for stap, omschrijving, duur, success in self.wacht_tijden:
+            aantal, totaal, mislukt = rapport.get(stap, (0, 0.0, 0))
+            rapport[stap] = (aantal + 1, totaal + duur, mislukt + (not success))
+        return rapport
+
+    def execute(self, driver_command, params=None):
+        # Alle WebDriver calls komen hier langs, dus hier worden de round-trips geteld
+        # en vervalt de snapshot als de pagina kan veranderen
+        if driver_command in MUTERENDE_COMMANDS:
+            self.vergeet_pagina()
+        start = time.time()
+        try:
+            return super().execute(driver_command, params)
+        except StaleElementReferenceException:
+            self.vergeet_pagina()
+            raise
+        finally:
+            if self.metrics:
+                self.metrics.driver_call(time.time() - start)
+
+    def get(self, url):
+        # Een nieuwe pagina maakt alles wat van de vorige pagina gelezen is ongeldig
+        self._speler_index = None
+        start = time.time()
+        super().get(url)
+        if self.metrics:
+            self.metrics.pagina(url, time.time() - start)
+
     def go_to_url(self, link):
-        self.get('http://www.onlinesoccermanager.nl/' + link)
+        self.get(BASE_URL + link)
+
+    def op_pagina(self, link):
+        return self.current_url.rstrip('/').endswith('/' + link)
+
+    def naar_pagina(self, link):
+        """
+            Laadt de pagina, tenzij de vorige stap op deze browser gelukt is en de browser er al op staat
+        """
+        if self.vorige_stap is None or not self.op_pagina(link):
+            self.go_to_url(link)
+
+    def vergeet_pagina(self):
+        self._pagina = None
+        self._html = None
+
+    def snapshot(self, *selectors):
+        """
+            Geeft per CSS selector, of (container, selector), de PaginaElementen van de pagina. Selectors die nog niet in de snapshot staan
+            worden samen met de rest in een enkele call opgehaald, daarna komen ze uit de snapshot.
+            De snapshot vervalt bij elke klik, toetsaanslag, script of navigatie, en bij elke controle in wacht.
+        """
+        pagina = self._pagina or {}
+        if any(selector not in pagina for selector in selectors):
+            alle = list(pagina) + [selector for selector in selectors if selector not in pagina]
+            # Het script zelf maakt de oude snapshot leeg, daarom alles opnieuw
+            resultaat = self.execute_script(SNAPSHOT_SCRIPT, alle)
+            pagina = {selector: [PaginaElement(*element) for element in elementen]
+                      for selector, elementen in zip(alle, resultaat)}
+            self._pagina = pagina
+        return pagina
+
+    def zoek(self, selector, *mee):
+        """
+            Geeft de PaginaElementen voor de selector. De selectors in mee worden in dezelfde call opgehaald.
+        """
+        return self.snapshot(selector, *mee)[selector]
+
+    def tekst(self, selector, *mee):
+        elementen = self.zoek(selector, *mee)
+        return elementen[0].tekst if elementen else None
+
+    def pagina_html(self):
+        if self._html is None:
+            self._html = self.page_source
+        return self._html
 
     def read_table(self):
-        html = self.page_source
-        soup = BeautifulSoup(html, 'lxml')
-        table = '<table>'
-        table = table + str(soup.find('thead'))
-        table = table + '<tbody>'
-        table = table + ''.join(str(soup.find_all('tr')))
-        table = table + '</tbody></table>'
-        res = pd.read_html(table, header=0)
-        if len(res) > 1:
-            FileError("Meerdere tabellen gevonden")
-        else:
-            res = res[0]
-            res = res.iloc[1:]
-        return res
+        return parse_table(self.pagina_html())
 
     def get_spelers(self):
         spelers = self.read_table()
         get_col = spelers.columns[1]
+        spelers = maak_int(spelers, [kolom for kolom in INT_KOLOMMEN if kolom in spelers.columns])
+        if self.opslag:
+            self.opslag.bewaar('selectie', spelers.to_dict('records'))
         spelers_raw = copy.copy(spelers)
-        spelers['leeftijd'] = spelers[get_col].str[-3:-1]
+        spelers['leeftijd'] = pd.to_numeric(spelers[get_col].str[-3:-1], errors='coerce')
         spelers = spelers.sort_values(['leeftijd'])
         return spelers, spelers_raw, get_col
 
-    def train(self, slack_client, i):
-        self.go_to_url('Training')
-        time.sleep(1)
-        training_container = self.find_element_by_class_name('knockout-loader-content')
-        trainingen = training_container.find_elements_by_class_name("btn")
-        training = trainingen[i]
-        if training.text[-1:] == 'K':
-            training.click()
+    def speler_index(self):
+        """
+            Geeft de index van de spelerstabel die nu open staat.
+            De tabel wordt maar een keer per paginalading gelezen, alleen de elementen worden ververst.
+        """
+        if self._speler_index is None:
             spelers, spelers_raw, get_col = self.get_spelers()
-            clickable_spelers = self.find_elements_by_css_selector('tr.clickable')
-            while not spelers.empty:
-                speler = spelers[get_col].values[0]
-                correct_speler = clickable_spelers[np.where(spelers_raw[get_col] == speler)[0][0]]
-                correct_speler.click()
-                try:
-                    self.find_element_by_class_name('modal-v2').find_element_by_class_name('close').click()
-                    spelers = spelers.iloc[1:]
-                except:
+            self._speler_index = SpelerIndex(spelers.index)
+        self._speler_index.ververs(self)
+        return self._speler_index
+
+    def train(self, slack_client, i):
+        # De trainingspagina hoeft niet opnieuw geladen te worden als de vorige stap er gelukt is
+        self.naar_pagina('Training')
+        self.wait_on_class('knockout-loader-content', 'train')
+        self.wait_on_loader('train')
+        training = self.zoek(TRAINING_KNOPPEN)[i]
+        if training.tekst[-1:] == 'K':
+            training.element.click()
+            self.wait_on_class('clickable', 'train')
+            index = self.speler_index()
+            for sleutel in index.volgorde:
+                speler = index.element(sleutel)
+                if speler is None:
+                    continue
+                speler.click()
+                # De knop van het slot toont de nieuwe training, of een modal meldt dat de speler al traint
+                if not self.wait_on_text_change(training.element, training.tekst, 'train', '.modal-v2 .close'):
+                    raise TimeoutException('geen reactie op het kiezen van een speler voor slot {}'.format(i))
+                sluit = self.zoek('.modal-v2 .close')
+                if not sluit:
                     post_to_slack(slack_client, 'Nieuwe speler geselecteerd')
-                    spelers = spelers.head(0)
+                    break
+                # Deze speler kan niet getraind worden, dan de volgende proberen
+                sluit[0].element.click()
+                self.wait_until_gone(sluit[0].element, 'train')
 
     def rond_training_af(self, slack_client):
         self.go_to_url('Training')
-        self.wait_on_class('btn-show-result')
-        time.sleep(3)
-        for button in self.find_elements_by_class_name('btn-show-result'):
-            button.click()
+        self.wait_on_class('knockout-loader-content', 'train')
+        self.wait_on_loader('train')
+        self.wait_on_network_idle('train')
+        # Alleen afgeronde trainingen hebben een resultaat knop, dus er hoeft niet op gewacht te worden
+        for button in self.zoek('.btn-show-result'):
+            button.element.click()
             post_to_slack(slack_client, 'Speler getraind')
 
+    def lees_planning(self):
+        """
+            Leest de timers van de trainingen, en via de api de aftrap en de rente, en schrijft het plan voor de
+            volgende runs. Een fout hierin laat de run niet mislukken, de planner valt dan terug op zijn interval.
+        """
+        if not dict(PLANNER_OPTIES, **getattr(settings, 'planner', {}))['adaptief']:
+            return
+        try:
+            self.naar_pagina('Training')
+            self.wait_on_class('knockout-loader-content', 'train')
+            self.wait_on_loader('train')
+            teksten = [knop.tekst for knop in self.zoek(TRAINING_KNOPPEN)]
+        except WebDriverException:
+            error_logger.error('timers van de trainingen niet gelezen, geen nieuw plan')
+            return
+        try:
+            timers = [0 if tekst.strip()[-1:] == 'K' else parse_resterend(tekst) for tekst in teksten]
+            aftrap = self.data.aftrap() if self.data else None
+            rente_vrij = self.data.rente_vrij() if self.data else None
+            momenten = maak_plan(timers, aftrap, rente_vrij)
+            Plan(os.path.join(settings.directory, 'plan.json')).zet(momenten)
+        except Exception as fout:
+            # Een onverwachte tekst op een knop, of plan.json kan niet geschreven worden
+            error_logger.error('geen nieuw plan: {!r}'.format(fout))
+            return
+        for moment in momenten:
+            info_logger.info('gepland: {} om {:%H:%M}'.format(moment['reden'], moment['tijd']))
+
     def haal_bonus_op(self):
-        toasts = self.find_elements_by_class_name('toastContent')
-        for toast in toasts:
+        # De toasts komen op elke pagina, dus op het ControlCentre als de browser er nog niet staat
+        self.naar_pagina('ControlCentre')
+        self.wait_on_loader('bonus')
+        for toast in [toast.element for toast in self.zoek('.toastContent')]:
             toast.click()
-            time.sleep(1)
+            self.wait_until_gone(toast, 'bonus')
             info_logger.info('Op toast geklikt')
             post_to_slack(slack_client, 'Op toast geklikt')
 
     def transfer_geld(self, richting, iteration=0):
+        if richting == 'af' and self.data and self.data.rente() == 0:
+            # Er staat niets op de bank, de pagina hoeft niet geopend te worden
+            return
         self.go_to_url('ControlCentre')
-        time.sleep(5)
-        self.wait_on_xpath("//div[@id='clubfunds-amount']")
+        self.wait_on_xpath("//div[@id='clubfunds-amount']", 'transfer_geld')
+        self.wait_on_loader('transfer_geld')
         # Open het bank scherm
         self.find_element_by_xpath("//div[@id='clubfunds-amount']").click()
-        time.sleep(5)
-        self.wait_on_xpath("//span[@data-bind='currency: financePartial().interest']")
-        huidige_rente = self.find_element_by_xpath("//span[@data-bind='currency: financePartial().interest']").text
+        self.wait_on_xpath("//span[@data-bind='currency: financePartial().interest']", 'transfer_geld')
+        self.wait_on_network_idle('transfer_geld')
+        huidige_rente = self.tekst("span[data-bind='currency: financePartial().interest']")
         geld_op_de_bank = huidige_rente != '0'
         if richting == 'af':
             if geld_op_de_bank:
+                self.wait_on_xpath("//span[contains(., 'Overmaken')]", 'transfer_geld')
                 self.find_element_by_xpath("//span[contains(., 'Overmaken')]").click()
                 info_logger.info('geld van bank gehaald')
                 post_to_slack(slack_client, 'Geld van de bank')
         elif richting == 'op':
             if not geld_op_de_bank:
-                self.wait_on_xpath("//span[contains(., 'Overmaken')]")
+                self.wait_on_xpath("//span[contains(., 'Overmaken')]", 'transfer_geld')
                 self.find_element_by_xpath("//span[contains(., 'Overmaken')]").click()
                 info_logger.info('geld op de bank gezet')
                 post_to_slack(slack_client, 'Geld op de bank')
@@ -224,8 +927,16 @@ class OsmDriver(settings.driver):
             post_to_slack(slack_client, 'Onbekende richting om geld op te zetten')
 
     def haal_scheidsrechter_hardheid_op(self):
+        level = self.data.scheidsrechter() if self.data else None
+        if level is None:
+            level = self.lees_scheidsrechter()
+        if self.opslag:
+            self.opslag.bewaar('scheidsrechter', level)
+        return level
+
+    def lees_scheidsrechter(self):
         self.go_to_url('League/Fixtures')
-        self.wait_on_class('highlight')
+        self.wait_on_class('highlight', 'hardheid')
         highlight = self.find_elements_by_class_name('highlight')
         level = 0
         if highlight:
@@ -253,8 +964,6 @@ class OsmDriver(settings.driver):
         level = self.haal_scheidsrechter_hardheid_op()
         # level = 0 betekent dat er geen wedstrijd is.
         if level > 0:
-            self.go_to_url('Tactics')
-            self.wait_on_xpath('//div[@id="carousel-tacticstyleofplay"]')
             doel = ''
             if level == 5:
                 doel = 'Voorzichtig'
@@ -262,103 +971,451 @@ class OsmDriver(settings.driver):
                 doel = 'Normaal'
             elif level in [3, 2, 1]:
                 doel = 'Agressief'
-            correct = False
-            while not correct:
-                agg_element = self.find_element_by_id('carousel-tacticstyleofplay')
-                huidige_level = agg_element.text
-                if doel == huidige_level:
-                    correct = True
-                else:
-                    self.wait_on_xpath('button-arrow-right')
-                    time.sleep(1)
-                    agg_element.find_element_by_class_name('button-arrow-right').click()
-                    time.sleep(1)
-            post_to_slack(slack_client, 'Scheids goed gezet')
+            if self.opslag and self.opslag.ongewijzigd('speelstijl', doel):
+                info_logger.info('speelstijl staat sinds de vorige run op {}'.format(doel))
+                return
+            self.go_to_url('Tactics')
+            self.wait_on_xpath('//div[@id="carousel-tacticstyleofplay"]', 'hardheid')
+
+            # Het label en de pijlen komen samen uit de snapshot
+            selectors = ['#carousel-tacticstyleofplay', '#carousel-tacticstyleofplay .button-arrow-right',
+                         '#carousel-tacticstyleofplay .button-arrow-left']
+
+            carrousel = Carrousel(self, 'tacticstyleofplay', lambda: self.tekst(*selectors),
+                                  lambda: self.zoek(selectors[1], *selectors)[0].element,
+                                  lambda: self.zoek(selectors[2], *selectors)[0].element,
+                                  stap='hardheid')
+            if carrousel.ga_naar(doel):
+                post_to_slack(slack_client, 'Scheids goed gezet')
+                if self.opslag:
+                    self.opslag.bewaar('speelstijl', doel)
+            else:
+                FileError('Speelstijl {} niet gevonden'.format(doel), slack_client)
+
+    def sponsor_aanbiedingen(self):
+        """
+            Geeft de teksten van alle aanbiedingen in de carrousel en de index van het aanbod dat getoond wordt, of -1
+        """
+        teksten, huidig = self.execute_script(SPONSOR_SCRIPT)
+        return teksten, huidig
+
+    def huidige_sponsor_prijs(self):
+        """
+            Geeft de prijs van het aanbod dat de carrousel nu toont, of None
+        """
+        teksten, huidig = self.sponsor_aanbiedingen()
+        try:
+            return parse_sponsor_prijs(teksten[huidig]) if huidig >= 0 else None
+        except (IndexError, ValueError):
+            return None
+
+    def lees_sponsor_aanbiedingen(self):
+        """
+            Leest de prijzen van alle aanbiedingen in de carrousel van een contractplek, en de index van het aanbod
+            dat getoond wordt. Het liefst in een enkele call, anders door de carrousel een keer rond te gaan.
+        """
+        teksten, huidig = self.sponsor_aanbiedingen()
+        try:
+            prijzen = [parse_sponsor_prijs(tekst) for tekst in teksten]
+        except (IndexError, ValueError):
+            prijzen = []
+        if len(prijzen) > 1 and huidig >= 0:
+            return prijzen, huidig
+
+        # Alleen het getoonde aanbod staat op de pagina. Na een rondje staan we weer bij hetzelfde aanbod.
+        prijzen = []
+        for i in range(0, 6):
+            prijzen.append(self.huidige_sponsor_prijs())
+            self.zoek('.carousel-next')[0].element.click()
+        return prijzen, 0
 
     def selecteer_sponsor(self):
-        if self.find_elements_by_class_name('icon-notification-sponsor'):
+        # De melding staat in de kop van elke pagina, maar een extra browser staat nog op een lege pagina
+        self.naar_pagina('ControlCentre')
+        self.wait_on_loader('sponsor')
+        if self.zoek('.icon-notification-sponsor'):
             self.go_to_url('Sponsors')
-            self.wait_on_class('no-contract-container')
-            contract_slots = self.find_elements_by_class_name('no-contract-container')
-            for slot in contract_slots:
-                slot.click()
-                max_price = 0
-                for i in range(0, 6):
-                    price = self.find_element_by_class_name('choosesponsor-top').text.split('\n')[3][:-1]
-                    if int(price) > max_price:
-                        max_price = int(price)
-                    self.find_element_by_class_name('carousel-next').click()
-                empty = True
-                while empty:
-                    price = self.find_element_by_class_name('choosesponsor-top').text.split('\n')[3][:-1]
-                    if int(price) == max_price:
-                        self.find_element_by_xpath('//span[text()="Bevestig"]')
-                        info_logger.info('Sponsor toegevoegd: {}K'.format(price))
-                        post_to_slack(slack_client, 'Sponsor toegevoegd: {}K'.format(price))
-                        empty = False
+            self.wait_on_class('no-contract-container', 'sponsor')
+            aantal_slots = len(self.zoek('.no-contract-container'))
+            for _ in range(aantal_slots):
+                # Na het bevestigen wordt de pagina opnieuw opgebouwd, dus steeds de eerste lege plek opnieuw zoeken
+                contract_slots = self.zoek('.no-contract-container')
+                if not contract_slots:
+                    break
+                contract_slots[0].element.click()
+                self.wait_on_class('choosesponsor-top', 'sponsor')
+                # Prijzen kunnen dubbel voorkomen, dus navigeren op index vanaf het aanbod dat getoond wordt
+                prijzen = self.data.sponsor_prijzen() if self.data else None
+                prijs = None
+                for _ in range(2):
+                    if prijzen:
+                        # De api geeft de volgorde van de carrousel, welk aanbod getoond wordt staat op de pagina
+                        van = max(self.sponsor_aanbiedingen()[1], 0)
                     else:
-                        self.find_element_by_class_name('carousel-next').click()
+                        prijzen, van = self.lees_sponsor_aanbiedingen()
+                    beste = int(np.argmax(prijzen))
+                    carrousel = Carrousel(self, None, self.huidige_sponsor_prijs,
+                                          lambda: self.zoek('.carousel-next', '.carousel-prev')[0].element,
+                                          lambda: self.zoek('.carousel-prev', '.carousel-next')[0].element,
+                                          volgorde=prijzen, stap='sponsor')
+                    carrousel.naar_index(van, beste)
+                    if self.wacht(lambda driver: carrousel.lees() == prijzen[beste], 'sponsor aanbod', 'sponsor'):
+                        prijs = prijzen[beste]
+                        break
+                    # De aanbiedingen uit de api kloppen niet met de carrousel: opnieuw lezen van de pagina
+                    info_logger.info('sponsor aanbiedingen wijken af, opnieuw lezen van de pagina')
+                    prijzen = None
+
+                if prijs is None:
+                    FileError('Beste sponsor niet gevonden', slack_client)
+                    continue
+                self.wait_on_xpath('//span[text()="Bevestig"]', 'sponsor')
+                self.find_element_by_xpath('//span[text()="Bevestig"]').click()
+                self.wait_on_network_idle('sponsor')
+                info_logger.info('Sponsor toegevoegd: {}K'.format(prijs))
+                post_to_slack(slack_client, 'Sponsor toegevoegd: {}K'.format(prijs))
+
+    def open_spelerkeuze(self):
+        """
+            Opent de spelerkeuze van de actieve specialist slide
+        """
+        self.wait_on_class('slidee', 'specialist')
+        self.wait_on_class('active', 'specialist')
+        self.wait_on_loader('specialist')
+        wijzig = self.zoek('.slidee .active .change-player-link')
+        if wijzig:
+            wijzig[0].element.click()
+        else:
+            self.wait_on_xpath('//div[text()="Kies speler"]', 'specialist')
+            self.find_element_by_xpath('//div[text()="Kies speler"]').click()
+        self.wait_on_class('td-player-name', 'specialist')
+        self.wait_on_network_idle('specialist')
+
+    def sluit_spelerkeuze(self):
+        """
+            Sluit de spelerkeuze zonder een speler te kiezen. Zonder sluitknop wordt de pagina opnieuw geladen.
+        """
+        sluit = self.zoek('.modal-v2 .close, .modal .close')
+        if sluit:
+            sluit[0].element.click()
+            self.wait_until_gone(sluit[0].element, 'specialist')
+        else:
+            self.go_to_url('Specialists')
+            self.wait_on_class('slidee', 'specialist')
+            self.wait_on_loader('specialist')
+
+    def klik_speler(self, naam):
+        """
+            Zoekt de speler in een enkele call op naam op en klikt erop
+        """
+        speler = self.execute_script("""
+            var cellen = document.getElementsByClassName('td-player-name');
+            for (var i = 0; i < cellen.length; i++) {
+                if (cellen[i].innerText.trim() === arguments[0]) { return cellen[i]; }
+            }
+            return null;
+        """, naam)
+        if speler:
+            speler.click()
+            self.wait_on_network_idle('specialist')
+        return speler is not None
 
     def zet_specialist_goed(self):
+        # De selectie hoeft maar een keer gelezen te worden voor alle specialisten. Het liefst via de api,
+        # dan hoeft de spelerskeuze niet open als alles al goed staat.
+        spelers = self.data.spelers() if self.data else None
+        if spelers is not None:
+            gekozen = kies_specialisten(spelers)
+            if self.opslag:
+                self.opslag.bewaar_spelers(spelers)
+                if self.opslag.ongewijzigd('specialisten', gekozen):
+                    info_logger.info('specialisten ongewijzigd sinds de vorige run')
+                    return
+
         self.go_to_url('Specialists')
-        for i in range(0, 4):
-            self.wait_on_class('slidee')
-            self.wait_on_class('active')
-            time.sleep(2)
-            active = self.find_element_by_class_name('slidee').find_element_by_class_name('active')
-            if active.find_elements_by_class_name('change-player-link'):
-                active.find_element_by_class_name('change-player-link').click()
-            else:
-                active.find_element_by_xpath('//div[text()="Kies speler"]').click()
-            self.wait_on_class('table')
-            time.sleep(4)
-            speler_overzicht = self.read_table()
-            speler_overzicht.columns = np.append('positie', speler_overzicht.columns.values[:-1])
-            speler_overzicht = speler_overzicht[
-                ~speler_overzicht['positie'].isin(['Aanvallers', 'Middenvelders', 'Verdedigers', 'Keepers'])]
-
-            # Aanvoerder
-            if i == 0:
-                # Selecteer de oudste, en dan de eerste
-                speler_overzicht['aanvoerder'] = speler_overzicht['Ver'].astype(int) / 2 + speler_overzicht[
-                    'Lft'].astype(int)
-                aanvoerder = speler_overzicht.sort_values(by=['aanvoerder'], ascending=False)['Aanvallers'].values[0]
-                for speler in self.find_elements_by_class_name('td-player-name'):
-                    if speler.text == aanvoerder:
-                        speler.click()
-                        time.sleep(4)
-                self.find_element_by_class_name('slider-next').click()
-            # Penalty
-            if i == 1:
-                speler_overzicht = speler_overzicht[~speler_overzicht['Aanvallers'].isin([aanvoerder])]
-                speler_overzicht['penalty'] = speler_overzicht['Aan'].astype(int) / 2 + speler_overzicht[
-                    'Lft'].astype(int)
-                penalty = speler_overzicht.sort_values(by=['penalty'], ascending=False)['Aanvallers'].values[0]
-                for speler in self.find_elements_by_class_name('td-player-name'):
-                    if speler.text == penalty:
-                        speler.click()
-                        time.sleep(4)
-                self.find_element_by_class_name('slider-next').click()
-            # Vrije trappen
-            if i == 2:
-                speler_overzicht = speler_overzicht[~speler_overzicht['Aanvallers'].isin([aanvoerder, penalty])]
-                speler_overzicht['vrij'] = speler_overzicht['Aan'].astype(int)
-                vrij = speler_overzicht.sort_values(by=['vrij'], ascending=False)['Aanvallers'].values[0]
-                for speler in self.find_elements_by_class_name('td-player-name'):
-                    if speler.text == vrij:
-                        speler.click()
-                        time.sleep(4)
-                self.find_element_by_class_name('slider-next').click()
-            # Corners
-            if i == 3:
-                speler_overzicht = speler_overzicht[~speler_overzicht['Aanvallers'].isin([aanvoerder, penalty, vrij])]
-                speler_overzicht['corner'] = speler_overzicht['Aan'].astype(int) + speler_overzicht['Ver'].astype(
-                    int) / 5
-                corner = speler_overzicht.sort_values(by=['corner'], ascending=False)['Aanvallers'].values[0]
-                for speler in self.find_elements_by_class_name('td-player-name'):
-                    if speler.text == corner:
-                        speler.click()
-                        time.sleep(4)
+        self.wait_on_class('slidee', 'specialist')
+        self.wait_on_loader('specialist')
+        # De naam van de huidige specialist van alle slides in een keer, een lege slide geeft ''
+        huidig = self.execute_script(
+            "return Array.prototype.map.call(document.querySelectorAll('.slidee > *'), function (s) {"
+            "    var naam = s.querySelector('.specialist-name'); return naam ? naam.innerText.trim() : ''; });")
+
+        keuze_open = spelers is None
+        if keuze_open:
+            self.open_spelerkeuze()
+            spelers = specialisten_overzicht(self.read_table())
+            gekozen = kies_specialisten(spelers)
+            if self.opslag:
+                self.opslag.bewaar_spelers(spelers)
+        te_zetten = [i for i, speler in enumerate(gekozen) if i >= len(huidig) or speler != huidig[i]]
+        info_logger.info('specialisten: {}'.format(', '.join(gekozen)))
+
+        if keuze_open and 0 not in te_zetten:
+            self.sluit_spelerkeuze()
+        if not te_zetten:
+            info_logger.info('specialisten staan al goed')
+            if self.opslag:
+                self.opslag.bewaar('specialisten', gekozen)
+            return
+
+        slider = Carrousel(self, None,
+                           lambda: self.execute_script(
+                               "var slidee = document.getElementsByClassName('slidee')[0];"
+                               "return Array.prototype.indexOf.call(slidee.children, slidee.querySelector('.active'));"),
+                           lambda: self.zoek('.slider-next', '.slider-prev')[0].element,
+                           lambda: self.zoek('.slider-prev', '.slider-next')[0].element,
+                           volgorde=list(range(len(gekozen))), cyclisch=False, stap='specialist')
+        gelukt = True
+        for i in te_zetten:
+            if not slider.ga_naar(i):
+                FileError('Specialist slide {} niet gevonden'.format(i), slack_client)
+                gelukt = False
+                continue
+            self.wait_on_loader('specialist')
+            if i != 0 or not keuze_open:
+                self.open_spelerkeuze()
+            if not self.klik_speler(gekozen[i]):
+                FileError('Specialist {} niet gevonden'.format(gekozen[i]), slack_client)
+                gelukt = False
+        if gelukt and self.opslag:
+            self.opslag.bewaar('specialisten', gekozen)
+
+
+class OsmDataClient:
+    """
+        Leest data rechtstreeks uit de JSON api van de OSM frontend, met de cookies en het token van de ingelogde browser.
+        Verwachte antwoorden (velden staan bij de functies):
+            spelers:   [{'name', 'age', 'position', 'statAtt', 'statDef'}, ...]
+            wedstrijd: {'refereeStrictness': 1 (heel mild) t/m 5 (heel streng), 'kickoff': unix tijd},
+                       of leeg als er geen wedstrijd is
+            financien: {'interest': rente van het geld op de bank, 'depositEnd': unix tijd waarop de rente vrijkomt}
+            sponsors:  [{'name', 'price'}, ...] in de volgorde van de carrousel, prijs in K
+        Elke functie geeft None terug als het niet lukt, dan leest OsmDriver de pagina zoals voorheen.
+        Na een mislukte call wordt de client voor de rest van de run uitgezet, zodat er niet steeds gewacht wordt.
+    """
+
+    def __init__(self, api, ids, cookies=(), token=None, timeout=10):
+        self.api = api
+        self.ids = ids
+        self.timeout = timeout
+        self.aan = True
+        self.sessie = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4,
+                              max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]))
+        self.sessie.mount('http://', adapter)
+        self.sessie.mount('https://', adapter)
+        self.sessie.headers['Accept'] = 'application/json'
+        if token:
+            self.sessie.headers['Authorization'] = 'Bearer {}'.format(token)
+        for cookie in cookies:
+            self.sessie.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''),
+                                    path=cookie.get('path', '/'))
+
+    @classmethod
+    def van_browser(cls, browser):
+        """
+            Maakt een client met de sessie van de browser. Geeft None terug als de api uit staat of de ids ontbreken.
+        """
+        api = dict(API, **getattr(settings, 'api', {}))
+        if not api['aan']:
+            return None
+        opslag = browser.execute_script(LOCAL_STORAGE_SCRIPT) or {}
+        ids = {
+            'league': api.get('league', opslag.get(api['league_sleutel'])),
+            'team': api.get('team', opslag.get(api['team_sleutel'])),
+        }
+        if None in ids.values():
+            info_logger.info('api niet gebruikt: competitie of team onbekend')
+            return None
+        return cls(api, ids, browser.get_cookies(), opslag.get(api['token_sleutel']))
+
+    def haal(self, endpoint):
+        if not self.aan:
+            return None
+        url = self.api['base_url'] + self.api[endpoint].format(**self.ids)
+        try:
+            antwoord = self.sessie.get(url, timeout=self.timeout)
+            antwoord.raise_for_status()
+            return antwoord.json()
+        except (requests.RequestException, ValueError) as fout:
+            info_logger.info('api {} mislukt, terug naar de pagina: {}'.format(endpoint, fout))
+            self.aan = False
+            return None
+
+    def spelers(self):
+        """
+            Geeft de selectie in dezelfde vorm als specialisten_overzicht
+        """
+        data = self.haal('spelers')
+        if data is None:
+            return None
+        try:
+            spelers = pd.DataFrame([[speler['position'], speler['name'], speler['age'], speler['statAtt'],
+                                     speler['statDef']] for speler in data],
+                                   columns=['positie', 'Aanvallers', 'Lft', 'Aan', 'Ver'])
+        except (KeyError, TypeError):
+            return None
+        return maak_int(spelers, INT_KOLOMMEN)
+
+    def scheidsrechter(self):
+        data = self.haal('wedstrijd')
+        if data is None:
+            return None
+        if not isinstance(data, dict):
+            return None
+        # Een leeg antwoord betekent geen wedstrijd, level 0 net als op de pagina.
+        # Ontbreekt het veld in een wel gevuld antwoord, dan klopt de api niet en wordt de pagina gelezen.
+        if not data:
+            return 0
+        try:
+            return int(data['refereeStrictness'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def rente(self):
+        data = self.haal('financien')
+        if not isinstance(data, dict) or 'interest' not in data:
+            return None
+        return data['interest']
+
+    def tijdstip(self, endpoint, veld):
+        data = self.haal(endpoint)
+        try:
+            return datetime.datetime.fromtimestamp(int(data[veld]))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def aftrap(self):
+        return self.tijdstip('wedstrijd', 'kickoff')
+
+    def rente_vrij(self):
+        return self.tijdstip('financien', 'depositEnd')
+
+    def sponsor_prijzen(self):
+        data = self.haal('sponsors')
+        try:
+            return [int(aanbod['price']) for aanbod in data] if data else None
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+class Carrousel:
+    """
+        Navigeert een carrousel via de kortste weg naar een optie.
+        De volgorde van de opties wordt een keer geleerd en per carrousel bewaard,
+        daarna worden alle klikken in een keer gedaan en wordt het resultaat een keer gecontroleerd.
+    """
+    # Geleerde volgorde van de opties per carrousel naam
+    volgordes = dict()
+
+    def __init__(self, driver, naam, lees, volgende, vorige=None, volgorde=None, cyclisch=True, max_stappen=20,
+                 stap='default'):
+        self.driver = driver
+        self.naam = naam
+        # Functies die de huidige optie en de pijlen teruggeven
+        self.lees = lees
+        self.volgende = volgende
+        self.vorige = vorige
+        self._volgorde = volgorde
+        self.cyclisch = cyclisch
+        self.max_stappen = max_stappen
+        self.stap = stap
+
+    def volgorde(self):
+        if self._volgorde is not None:
+            return self._volgorde
+        if self.naam not in Carrousel.volgordes:
+            Carrousel.volgordes[self.naam] = self.leer()
+        return Carrousel.volgordes[self.naam]
+
+    def leer(self):
+        """
+            Gaat de carrousel een keer rond om de volgorde van de opties te leren. Eindigt weer bij de eerste optie.
+        """
+        volgorde = [self.lees()]
+        for _ in range(self.max_stappen):
+            self.volgende().click()
+            self.driver.wacht(lambda driver: self.lees() != volgorde[-1], 'carrousel {}'.format(self.naam), self.stap)
+            optie = self.lees()
+            if optie == volgorde[0]:
+                break
+            volgorde.append(optie)
+        info_logger.info('carrousel {} geleerd: {}'.format(self.naam, volgorde))
+        return volgorde
+
+    def klik(self, pijl, aantal):
+        # Alle klikken in een enkele call
+        self.driver.execute_script('for (var i = 0; i < arguments[1]; i++) { arguments[0].click(); }', pijl, aantal)
+
+    def naar_index(self, van, naar):
+        """
+            Klikt in de kortste richting van optie van naar optie naar
+        """
+        aantal = len(self.volgorde())
+        vooruit = (naar - van) % aantal if self.cyclisch else naar - van
+        achteruit = (van - naar) % aantal if self.cyclisch else van - naar
+        if vooruit < 0 and not self.vorige:
+            raise ValueError('carrousel {} kan zonder vorige pijl niet terug van {} naar {}'.format(
+                self.naam, van, naar))
+        if (self.vorige and 0 < achteruit < vooruit) or vooruit < 0:
+            self.klik(self.vorige(), min(achteruit, self.max_stappen))
+        elif vooruit > 0:
+            self.klik(self.volgende(), min(vooruit, self.max_stappen))
+
+    def ga_naar(self, doel):
+        huidig = self.lees()
+        if huidig == doel:
+            return True
+        volgorde = self.volgorde()
+        if huidig in volgorde and doel in volgorde:
+            self.naar_index(volgorde.index(huidig), volgorde.index(doel))
+            if self.driver.wacht(lambda driver: self.lees() == doel, 'carrousel {}'.format(self.naam), self.stap):
+                return True
+
+        # De volgorde klopt niet (meer): vergeet hem en ga stap voor stap, met een maximum aantal stappen.
+        # Een carrousel die niet rond gaat wordt eerst vooruit doorlopen en vanaf het einde terug.
+        Carrousel.volgordes.pop(self.naam, None)
+        pijlen = [self.volgende] + ([self.vorige] if self.vorige and not self.cyclisch else [])
+        for _ in range(self.max_stappen * len(pijlen)):
+            huidig = self.lees()
+            if huidig == doel:
+                return True
+            pijlen[0]().click()
+            veranderd = self.driver.wacht(lambda driver: self.lees() != huidig, 'carrousel {}'.format(self.naam),
+                                          self.stap)
+            if not veranderd:
+                if len(pijlen) == 1:
+                    break
+                pijlen.pop(0)
+        return self.lees() == doel
+
+
+class SpelerIndex:
+    """
+        Koppelt elke rij van de spelerstabel aan zijn tr.clickable element.
+        De sleutel is het indexlabel uit parse_table, dat gelijk is aan de positie van de tr op de pagina.
+        Daardoor hoeft de volgorde van de rijen niet te kloppen en zijn dubbele namen geen probleem.
+    """
+
+    def __init__(self, volgorde):
+        # Sleutels van de spelers in de volgorde waarin ze getraind moeten worden
+        self.volgorde = list(volgorde)
+        self.elementen = dict()
+
+    def ververs(self, driver):
+        # Een enkele call die voor alle klikbare rijen hun positie en element teruggeeft
+        rijen = driver.execute_script("""
+            var rijen = document.getElementsByTagName('tr');
+            var res = [];
+            for (var i = 0; i < rijen.length; i++) {
+                if (rijen[i].classList.contains('clickable')) { res.push([i, rijen[i]]); }
+            }
+            return res;
+        """)
+        self.elementen = {positie: element for positie, element in rijen}
+
+    def element(self, sleutel):
+        return self.elementen.get(sleutel)
 
 
 class FileError(Exception):
@@ -387,62 +1444,796 @@ def create_logger(directory, name, level):
     return logging.getLogger(name)
 
 
-def run_script_within_try(slack_client):
-    # init
-    # Als gekozen voor Chrome, download eerst een chromedriver (https://sites.google.com/a/chromium.org/chromedriver/)
-    if settings.driver_path:
-        browser = OsmDriver(settings.driver_path)
-    else:
-        browser = OsmDriver()
+def proces_geheugen_mb(pid):
+    """
+        Geeft het geheugengebruik (RSS) van een proces en al zijn kindprocessen terug in MB.
+        Werkt alleen op Linux, geeft anders None terug.
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    kinderen = dict()
+    for naam in os.listdir('/proc'):
+        if naam.isdigit():
+            try:
+                with open('/proc/{}/stat'.format(naam)) as bestand:
+                    ouder = int(bestand.read().rsplit(')', 1)[1].split()[1])
+            except (IOError, IndexError, ValueError):
+                continue
+            kinderen.setdefault(ouder, []).append(int(naam))
 
-    browser.set_window_size(1920, 1080)
+    totaal = 0
+    te_doen = [pid]
+    while te_doen:
+        huidig = te_doen.pop()
+        te_doen.extend(kinderen.get(huidig, []))
+        try:
+            with open('/proc/{}/status'.format(huidig)) as bestand:
+                for regel in bestand:
+                    if regel.startswith('VmRSS:'):
+                        totaal += int(regel.split()[1])
+        except IOError:
+            continue
+    return totaal / 1024
 
 
+def beschikbaar_geheugen_mb():
+    """
+        Geeft het beschikbare geheugen van de host in MB terug. Werkt alleen op Linux, geeft anders None terug.
+    """
     try:
-        # login op osm en de juiste competitie
-        browser.login(settings.username, settings.password, slack_client)
-
-        # Haal geld van de bank
-        browser.transfer_geld('af')
-        # Klik op afronden bij de trainingen
-        browser.rond_training_af(slack_client)
-
-        # Train speler
-        for i in range(0, 4):
-            browser.train(slack_client, i)
-
-        # Zet specialisten goed
-        browser.zet_specialist_goed()
-
-        # Zet hardheid tactiek goed (nog af te maken)
-        browser.zet_hardheid_goed()
-
-        # Klik op mogelijke bonus
-        browser.haal_bonus_op()
-
-        # Selecteer de sponsor als die bestaat
-        browser.selecteer_sponsor()
-
-        # Zet geld op de bank
-        browser.transfer_geld('op')
-        post_to_slack(slack_client, 'Script successfully run and browser closed')
-        success = True
-    except:
-        # Maak een screenshot en update slack
-        browser.save_screenshot('screenshot.png')
-        post_to_slack(slack_client, 'Script mislukt')
-        success = False
-    browser.close()
+        with open('/proc/meminfo') as bestand:
+            for regel in bestand:
+                if regel.startswith('MemAvailable:'):
+                    return int(regel.split()[1]) / 1024
+    except IOError:
+        pass
+    return None
+
+
+class Metrics:
+    """
+        Meet per stap van de pipeline de duur, het aantal WebDriver round-trips, de tijd in waits
+        en de paginaladingen. Wordt weggeschreven als JSON regels en optioneel als Prometheus tekstbestand.
+    """
+
+    def __init__(self):
+        self.run = datetime.datetime.now().isoformat()
+        self.start = time.time()
+        self.poging = 1
+        self.stappen = []
+        # Stappen kunnen tegelijk in verschillende threads lopen, elke thread meet zijn eigen stap
+        self.lokaal = threading.local()
+
+    @property
+    def huidig(self):
+        return getattr(self.lokaal, 'huidig', None)
+
+    @huidig.setter
+    def huidig(self, record):
+        self.lokaal.huidig = record
+
+    @contextlib.contextmanager
+    def stap(self, naam):
+        self.huidig = {'run': self.run, 'poging': self.poging, 'stap': naam, 'duur': 0.0, 'calls': 0,
+                       'driver_tijd': 0.0, 'waits': 0, 'wachttijd': 0.0, 'timeouts': 0, 'paginas': [],
+                       'gelukt': False}
+        start = time.time()
+        try:
+            yield self.huidig
+            self.huidig['gelukt'] = True
+        finally:
+            self.huidig['duur'] = time.time() - start
+            self.stappen.append(self.huidig)
+            self.huidig = None
+
+    def driver_call(self, duur):
+        if self.huidig:
+            self.huidig['calls'] += 1
+            self.huidig['driver_tijd'] += duur
+
+    def wacht(self, duur, success):
+        if self.huidig:
+            self.huidig['waits'] += 1
+            self.huidig['wachttijd'] += duur
+            self.huidig['timeouts'] += not success
+
+    def pagina(self, url, duur):
+        if self.huidig:
+            self.huidig['paginas'].append({'url': url, 'duur': duur})
+
+    def totalen(self):
+        """
+            Telt de stappen van alle pogingen per stap naam op
+        """
+        totalen = collections.OrderedDict()
+        for record in self.stappen:
+            totaal = totalen.setdefault(record['stap'], {'duur': 0.0, 'calls': 0, 'wachttijd': 0.0, 'pogingen': 0})
+            totaal['duur'] += record['duur']
+            totaal['calls'] += record['calls']
+            totaal['wachttijd'] += record['wachttijd']
+            totaal['pogingen'] += 1
+        return totalen
+
+    def schrijf(self, directory, gelukt):
+        with open(os.path.join(directory, 'metrics.jsonl'), 'a') as bestand:
+            for record in self.stappen:
+                bestand.write(json.dumps(record) + '\n')
+            bestand.write(json.dumps({'run': self.run, 'pogingen': self.poging, 'gelukt': gelukt,
+                                      'duur': time.time() - self.start}) + '\n')
+
+        prometheus = getattr(settings, 'metrics', {}).get('prometheus')
+        if prometheus:
+            regels = [
+                '# TYPE osm_run_duur_seconden gauge',
+                'osm_run_duur_seconden {:.3f}'.format(time.time() - self.start),
+                '# TYPE osm_run_pogingen gauge',
+                'osm_run_pogingen {}'.format(self.poging),
+                '# TYPE osm_run_gelukt gauge',
+                'osm_run_gelukt {}'.format(int(gelukt)),
+            ]
+            for metric, sleutel in [('osm_stap_duur_seconden', 'duur'), ('osm_stap_calls', 'calls'),
+                                    ('osm_stap_wachttijd_seconden', 'wachttijd'), ('osm_stap_pogingen', 'pogingen')]:
+                regels.append('# TYPE {} gauge'.format(metric))
+                for stap, totaal in self.totalen().items():
+                    regels.append('{}{{stap="{}"}} {}'.format(metric, stap, round(totaal[sleutel], 3)))
+            # Eerst naar een tijdelijk bestand, zodat een collector nooit een half bestand leest
+            with open(prometheus + '.tmp', 'w') as bestand:
+                bestand.write('\n'.join(regels) + '\n')
+            os.replace(prometheus + '.tmp', prometheus)
+
+    def samenvatting(self, gelukt):
+        regels = ['Run {} in {:.0f}s na {} poging(en)'.format(
+            'gelukt' if gelukt else 'mislukt', time.time() - self.start, self.poging)]
+        for stap, totaal in self.totalen().items():
+            regels.append('{}: {:.1f}s, {} calls, {:.1f}s wachten'.format(
+                stap, totaal['duur'], totaal['calls'], totaal['wachttijd']))
+        return '\n'.join(regels)
+
+
+def driver_argumenten(opties):
+    """
+        Geeft de argumenten voor OsmDriver waarmee settings.driver headless start met het lichte profiel
+    """
+    argumenten = dict()
+    if issubclass(settings.driver, webdriver.Chrome):
+        chrome = webdriver.ChromeOptions()
+        chrome.add_argument('--headless')
+        chrome.add_argument('--window-size={},{}'.format(*opties['window_size']))
+        chrome.add_argument('--blink-settings=imagesEnabled=false')
+        chrome.add_argument('--disk-cache-size={}'.format(opties['cache_mb'] * 1024 * 1024))
+        chrome.add_argument('--autoplay-policy=user-gesture-required')
+        chrome.add_argument('--mute-audio')
+        chrome.add_argument('--disable-extensions')
+        chrome.add_argument('--host-resolver-rules={}'.format(', '.join(
+            'MAP {0} ~NOTFOUND, MAP *.{0} ~NOTFOUND'.format(host) for host in opties['geblokkeerde_hosts'])))
+        for flag in opties['flags']:
+            chrome.add_argument(flag)
+        chrome.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        capabilities = chrome.to_capabilities()
+        capabilities['pageLoadStrategy'] = 'eager'
+        argumenten['desired_capabilities'] = capabilities
+    elif issubclass(settings.driver, webdriver.Firefox):
+        profiel = webdriver.FirefoxProfile()
+        profiel.set_preference('permissions.default.image', 2)
+        profiel.set_preference('gfx.downloadable_fonts.enabled', False)
+        profiel.set_preference('media.autoplay.default', 5)
+        profiel.set_preference('privacy.trackingprotection.enabled', True)
+        profiel.set_preference('browser.cache.disk.capacity', opties['cache_mb'] * 1024)
+        profiel.set_preference('browser.cache.memory.capacity', opties['cache_mb'] * 1024)
+        firefox = webdriver.FirefoxOptions()
+        firefox.add_argument('-headless')
+        for flag in opties['flags']:
+            firefox.add_argument(flag)
+        capabilities = webdriver.DesiredCapabilities.FIREFOX.copy()
+        capabilities['pageLoadStrategy'] = 'eager'
+        argumenten.update(firefox_profile=profiel, firefox_options=firefox, capabilities=capabilities)
+    elif issubclass(settings.driver, webdriver.PhantomJS):
+        # PhantomJS is altijd headless en kent geen page load strategy
+        capabilities = webdriver.DesiredCapabilities.PHANTOMJS.copy()
+        capabilities['phantomjs.page.settings.loadImages'] = False
+        argumenten['desired_capabilities'] = capabilities
+        argumenten['service_args'] = ['--load-images=false', '--disk-cache=true',
+                                      '--max-disk-cache-size={}'.format(opties['cache_mb'] * 1024)] + opties['flags']
+    return argumenten
+
+
+def maak_driver():
+    """
+        Start een nieuwe OsmDriver. Standaard headless met een licht profiel: geen afbeeldingen, media, fonts en trackers,
+        een kleiner scherm, een beperkte cache en een eager page load strategy.
+        Zet settings.lichte_driver op False om de gewone browser te zien bij het debuggen.
+    """
+    argumenten = dict()
+    # Als gekozen voor Chrome, download eerst een chromedriver (https://sites.google.com/a/chromium.org/chromedriver/)
+    if getattr(settings, 'driver_path', None):
+        argumenten['executable_path'] = settings.driver_path
+
+    if not getattr(settings, 'lichte_driver', True):
+        browser = OsmDriver(**argumenten)
+        browser.set_window_size(1920, 1080)
+        return browser
+
+    opties = dict(DRIVER_OPTIES, **getattr(settings, 'driver_opties', {}))
+    argumenten.update(driver_argumenten(opties))
+    browser = OsmDriver(**argumenten)
+    browser.set_window_size(*opties['window_size'])
+    if issubclass(settings.driver, webdriver.Chrome):
+        # Chrome kan zelf geen fonts en media blokkeren, dat gaat via het DevTools protocol van chromedriver
+        browser.command_executor._commands['send_command'] = ('POST', '/session/$sessionId/chromium/send_command')
+        try:
+            browser.execute('send_command', {'cmd': 'Network.enable', 'params': {}})
+            browser.execute('send_command', {'cmd': 'Network.setBlockedURLs',
+                                             'params': {'urls': opties['geblokkeerde_urls']}})
+        except WebDriverException:
+            info_logger.info('chromedriver ondersteunt het blokkeren van urls niet')
+    elif issubclass(settings.driver, webdriver.PhantomJS):
+        # Fonts, media en trackers via de page van PhantomJS, de command die execute_phantomjs in nieuwere selenium heeft
+        browser.command_executor._commands['executePhantomScript'] = ('POST', '/session/$sessionId/phantom/execute')
+        try:
+            browser.execute('executePhantomScript', {
+                'script': PHANTOM_BLOKKEER_SCRIPT,
+                'args': [opties['geblokkeerde_urls'], opties['geblokkeerde_hosts']]})
+        except WebDriverException:
+            info_logger.info('PhantomJS ondersteunt het blokkeren van urls niet')
+    return browser
+
+
+class DriverPool:
+    """
+        Houdt een warme, ingelogde browser vast tussen runs.
+        De browser wordt vervangen na max_runs runs, boven max_geheugen_mb of als hij niet meer reageert.
+        Met parallel > 1 staan er ook extra browsers klaar voor de stappen die tegelijk kunnen lopen.
+    """
+
+    def __init__(self, max_runs=20, max_geheugen_mb=1500, parallel=2):
+        self.max_runs = max_runs
+        self.max_geheugen_mb = max_geheugen_mb
+        self.parallel = max(parallel, 1)
+        self.browser = None
+        self.hulp = []
+        self.runs = 0
+
+    def nieuwe_browser(self):
+        return maak_driver()
+
+    def gezond(self, browser=None):
+        try:
+            return (browser or self.browser).execute_script('return 1;') == 1
+        except Exception:
+            return False
+
+    def geheugen_mb(self, browser=None):
+        try:
+            pid = (browser or self.browser).service.process.pid
+        except AttributeError:
+            return None
+        return proces_geheugen_mb(pid)
+
+    def pak(self):
+        """
+            Geeft een browser terug die klaar is voor een run
+        """
+        if self.browser:
+            geheugen = self.geheugen_mb()
+            if not self.gezond():
+                info_logger.info('browser reageert niet meer, nieuwe browser')
+                self.sluit()
+            elif self.runs >= self.max_runs:
+                info_logger.info('browser heeft {} runs gedaan, nieuwe browser'.format(self.runs))
+                self.sluit()
+            elif geheugen and geheugen > self.max_geheugen_mb:
+                info_logger.info('browser gebruikt {:.0f}MB, nieuwe browser'.format(geheugen))
+                self.sluit()
+        if not self.browser:
+            self.browser = self.nieuwe_browser()
+        return self.browser
+
+    def pak_hulp(self):
+        """
+            Geeft de extra browsers terug, parallel - 1 als ze allemaal willen starten.
+            Nieuwe browsers starten tegelijk, een browser die niet start wordt overgeslagen.
+        """
+        gezond = []
+        for browser in self.hulp:
+            geheugen = self.geheugen_mb(browser)
+            if self.gezond(browser) and not (geheugen and geheugen > self.max_geheugen_mb):
+                gezond.append(browser)
+            else:
+                info_logger.info('extra browser wordt vervangen')
+                self.sluit_browser(browser)
+        nieuw = self.parallel - 1 - len(gezond)
+        if nieuw > 0:
+            with ThreadPoolExecutor(max_workers=nieuw) as executor:
+                starts = [executor.submit(self.nieuwe_browser) for _ in range(nieuw)]
+            for start in starts:
+                try:
+                    gezond.append(start.result())
+                except WebDriverException:
+                    error_logger.error('extra browser kon niet gestart worden')
+        self.hulp = gezond
+        return list(self.hulp)
+
+    def warm(self):
+        return self.browser is not None and self.runs > 0
+
+    def geef_terug(self, gelukt):
+        # Ook na een mislukte poging blijft de browser in gebruik, zodat de volgende poging verder kan.
+        # Reageert hij niet meer, dan wordt hij bij pak() vervangen.
+        self.runs += 1
+
+    def sluit_browser(self, browser):
+        try:
+            browser.quit()
+        except Exception:
+            error_logger.error('browser kon niet afgesloten worden')
+
+    def sluit(self):
+        for browser in [self.browser] + self.hulp:
+            if browser:
+                self.sluit_browser(browser)
+        self.browser = None
+        self.hulp = []
+        self.runs = 0
+
+
+# De stappen van de pipeline: (naam, functie, maximaal aantal pogingen, stappen die eerst klaar moeten zijn).
+# Stappen die niet op elkaar wachten kunnen tegelijk in verschillende browsers lopen.
+# Elke stap moet veilig opnieuw uitgevoerd kunnen worden.
+PIPELINE = [
+    # Haal geld van de bank
+    ('transfer_geld_af', lambda browser, slack_client: browser.transfer_geld('af'), 3, []),
+    # Klik op afronden bij de trainingen
+    ('rond_training_af', lambda browser, slack_client: browser.rond_training_af(slack_client), 3, []),
+    # Train speler, met het geld van de bank. De slots na elkaar, ze staan op dezelfde pagina.
+    ('train_0', lambda browser, slack_client: browser.train(slack_client, 0), 3,
+     ['transfer_geld_af', 'rond_training_af']),
+    ('train_1', lambda browser, slack_client: browser.train(slack_client, 1), 3, ['train_0']),
+    ('train_2', lambda browser, slack_client: browser.train(slack_client, 2), 3, ['train_1']),
+    ('train_3', lambda browser, slack_client: browser.train(slack_client, 3), 3, ['train_2']),
+    # Zet specialisten goed
+    ('zet_specialist_goed', lambda browser, slack_client: browser.zet_specialist_goed(), 2, []),
+    # Zet hardheid tactiek goed
+    ('zet_hardheid_goed', lambda browser, slack_client: browser.zet_hardheid_goed(), 2, []),
+    # Klik op mogelijke bonus
+    ('haal_bonus_op', lambda browser, slack_client: browser.haal_bonus_op(), 2, []),
+    # Selecteer de sponsor als die bestaat
+    ('selecteer_sponsor', lambda browser, slack_client: browser.selecteer_sponsor(), 2, []),
+    # Zet geld op de bank, als laatste zodat ook de bonus en de sponsor rente opleveren
+    ('transfer_geld_op', lambda browser, slack_client: browser.transfer_geld('op'), 3,
+     ['train_3', 'haal_bonus_op', 'selecteer_sponsor']),
+    # Lees de timers van de nieuwe trainingen, de aftrap en de rente voor het plan van de volgende runs
+    ('lees_planning', lambda browser, slack_client: browser.lees_planning(), 1,
+     ['rond_training_af', 'train_0', 'train_1', 'train_2', 'train_3']),
+]
+
+# Pogingen voor het inloggen, dat voor elke poging opnieuw gecontroleerd wordt
+LOGIN_POGINGEN = 3
+# Pogingen voor het starten van de extra browsers en het overnemen van de sessie
+EXTRA_BROWSER_POGINGEN = 2
+
+
+class Checkpoint:
+    """
+        Houdt bij welke stappen van de pipeline al gedaan zijn, zodat een nieuwe poging verder gaat bij de mislukte stap.
+        Wordt opgeslagen, zodat een herstart van het script binnen max_leeftijd verder gaat waar hij was.
+        Met hervat=False wordt een opgeslagen checkpoint weggegooid en begint de run opnieuw.
+    """
+
+    def __init__(self, pad, max_leeftijd=datetime.timedelta(hours=1), hervat=True):
+        self.pad = pad
+        self.start = datetime.datetime.now()
+        self.gedaan = []
+        # Alleen in het geheugen: een nieuwe run begint weer met een volledig budget
+        self.pogingen = collections.Counter()
+        self.mislukt = None
+        if not hervat:
+            self.klaar()
+        elif os.path.isfile(pad):
+            try:
+                with open(pad) as bestand:
+                    data = json.load(bestand)
+                start = datetime.datetime.strptime(data['start'], '%Y-%m-%dT%H:%M:%S.%f')
+                if datetime.datetime.now() - start < max_leeftijd:
+                    self.start = start
+                    self.gedaan = data['gedaan']
+                    info_logger.info('verder vanaf checkpoint, al gedaan: {}'.format(', '.join(self.gedaan)))
+            except (ValueError, KeyError):
+                os.remove(pad)
+
+    def markeer(self, naam):
+        self.gedaan.append(naam)
+        with open(self.pad, 'w') as bestand:
+            json.dump({'start': self.start.strftime('%Y-%m-%dT%H:%M:%S.%f'), 'gedaan': self.gedaan}, bestand)
+
+    def mislukking(self, naam):
+        self.mislukt = naam
+        self.pogingen[naam] += 1
+
+    def budget_op(self, budgetten):
+        return self.pogingen[self.mislukt] >= budgetten.get(self.mislukt, 1)
+
+    def klaar(self):
+        if os.path.isfile(self.pad):
+            os.remove(self.pad)
+
+
+class Plan:
+    """
+        Het plan voor de volgende runs, bewaard als JSON zodat het een herstart overleeft.
+        Een moment is {'tijd', 'stappen', 'reden'}. Ook de tijd van de laatste run en van de laatste run van de
+        hele pipeline worden bewaard.
+    """
+    formaat = '%Y-%m-%dT%H:%M:%S'
+
+    def __init__(self, pad):
+        self.pad = pad
+        self.laatste_run = None
+        self.laatste_volledige_run = None
+        self.momenten = []
+        self.laad()
+
+    def laad(self):
+        if not os.path.isfile(self.pad):
+            return
+        try:
+            with open(self.pad) as bestand:
+                data = json.load(bestand)
+            laatste_run, laatste_volledige_run = [
+                data.get(sleutel) and datetime.datetime.strptime(data[sleutel], self.formaat)
+                for sleutel in ['laatste_run', 'laatste_volledige_run']]
+            momenten = [dict(moment, tijd=datetime.datetime.strptime(moment['tijd'], self.formaat))
+                        for moment in data['momenten']]
+        except (ValueError, KeyError, TypeError):
+            error_logger.error('plan niet te lezen, wordt opnieuw gemaakt')
+            return
+        self.laatste_run, self.laatste_volledige_run, self.momenten = laatste_run, laatste_volledige_run, momenten
+
+    def bewaar(self):
+        data = {
+            'laatste_run': self.laatste_run and self.laatste_run.strftime(self.formaat),
+            'laatste_volledige_run': self.laatste_volledige_run and self.laatste_volledige_run.strftime(self.formaat),
+            'momenten': [dict(moment, tijd=moment['tijd'].strftime(self.formaat)) for moment in self.momenten],
+        }
+        # Eerst naar een tijdelijk bestand, zodat een herstart nooit een half plan leest
+        with open(self.pad + '.tmp', 'w') as bestand:
+            json.dump(data, bestand)
+        os.replace(self.pad + '.tmp', self.pad)
+
+    def zet(self, momenten):
+        self.laad()
+        self.momenten = momenten
+        self.bewaar()
+
+    def volgende(self):
+        return min(self.momenten, key=lambda moment: moment['tijd']) if self.momenten else None
+
+    def verwijder_tot(self, tijd):
+        self.momenten = [moment for moment in self.momenten if moment['tijd'] > tijd]
+
+
+class Opslag:
+    """
+        Bewaart de toestand tussen runs in SQLite: snapshots van wat de stappen lezen en toepassen,
+        en per run de spelers, zodat de ontwikkeling van de selectie later op te vragen is.
+        Een snapshot wordt alleen toegevoegd als hij anders is dan de vorige van dezelfde soort, anders wordt
+        alleen bijgewerkt wanneer hij voor het laatst gezien is.
+        Een stap die iets toepast kan overgeslagen worden als hij hetzelfde zou toepassen als de vorige keer,
+        zolang die vorige keer niet ouder is dan max_leeftijd. Daarna wordt de pagina toch weer gecontroleerd.
+    """
+    schema = """
+        CREATE TABLE IF NOT EXISTS snapshots (
+            soort TEXT NOT NULL,
+            inhoud TEXT NOT NULL,
+            eerst TEXT NOT NULL,
+            laatst TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS snapshots_soort ON snapshots (soort, laatst);
+        CREATE TABLE IF NOT EXISTS spelers (
+            run TEXT NOT NULL,
+            volgnummer INTEGER NOT NULL,
+            naam TEXT NOT NULL,
+            positie TEXT,
+            leeftijd INTEGER,
+            aan INTEGER,
+            ver INTEGER,
+            PRIMARY KEY (run, volgnummer)
+        );
+    """
+
+    def __init__(self, pad, run, max_leeftijd=datetime.timedelta(hours=24)):
+        self.run = run
+        self.max_leeftijd = max_leeftijd
+        # Stappen lopen tegelijk in verschillende threads, die delen de verbinding
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(pad, check_same_thread=False)
+        self.db.executescript(self.schema)
+
+    def laatste(self, soort):
+        """
+            Geeft de laatste snapshot van een soort terug als (inhoud, laatst gezien), of None
+        """
+        with self.lock:
+            rij = self.db.execute('SELECT inhoud, laatst FROM snapshots WHERE soort = ? ORDER BY rowid DESC LIMIT 1',
+                                  (soort,)).fetchone()
+        if rij is None:
+            return None
+        return json.loads(rij[0]), datetime.datetime.strptime(rij[1], '%Y-%m-%dT%H:%M:%S.%f')
+
+    def bewaar(self, soort, inhoud):
+        nu = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')
+        tekst = json.dumps(inhoud, sort_keys=True, default=str)
+        with self.lock, self.db:
+            rij = self.db.execute('SELECT rowid, inhoud FROM snapshots WHERE soort = ? ORDER BY rowid DESC LIMIT 1',
+                                  (soort,)).fetchone()
+            if rij and rij[1] == tekst:
+                self.db.execute('UPDATE snapshots SET laatst = ? WHERE rowid = ?', (nu, rij[0]))
+            else:
+                self.db.execute('INSERT INTO snapshots VALUES (?, ?, ?, ?)', (soort, tekst, nu, nu))
+
+    def ongewijzigd(self, soort, inhoud):
+        """
+            Geeft True als de laatste snapshot van deze soort dezelfde inhoud heeft en niet ouder is dan max_leeftijd
+        """
+        laatste = self.laatste(soort)
+        if laatste is None:
+            return False
+        vorige, laatst = laatste
+        return (vorige == json.loads(json.dumps(inhoud, default=str))
+                and datetime.datetime.now() - laatst < self.max_leeftijd)
+
+    def bewaar_spelers(self, overzicht):
+        """
+            Bewaart de spelers uit een overzicht zoals specialisten_overzicht dat maakt, een keer per run.
+            De sleutel is de positie van de rij, namen hoeven niet uniek te zijn.
+        """
+        rijen = [(self.run, volgnummer, speler['Aanvallers'], speler['positie'], int(speler['Lft']),
+                  int(speler['Aan']), int(speler['Ver']))
+                 for volgnummer, (_, speler) in enumerate(overzicht.iterrows())]
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO spelers VALUES (?, ?, ?, ?, ?, ?, ?)', rijen)
+
+    def geschiedenis(self, naam=None):
+        """
+            Geeft de bewaarde spelers van alle runs als DataFrame, eventueel van een enkele speler
+        """
+        query = 'SELECT * FROM spelers' + (' WHERE naam = ?' if naam else '') + ' ORDER BY naam, run, volgnummer'
+        with self.lock:
+            return pd.read_sql_query(query, self.db, params=(naam,) if naam else ())
+
+    def sluit(self):
+        with self.lock:
+            self.db.close()
+
+
+class StapMislukt(Exception):
+    """
+        Een stap van de pipeline is mislukt. Onthoudt in welke browser, voor de screenshot.
+    """
+
+    def __init__(self, stap, browser):
+        super().__init__(stap)
+        self.stap = stap
+        self.browser = browser
+
+
+def voer_stappen_uit(browsers, executor, slack_client, checkpoint, meet, stappen=None):
+    """
+        Voert de stappen uit PIPELINE uit die nog niet gedaan zijn, zodra de stappen waar ze op wachten klaar zijn.
+        Met stappen alleen die stappen; op stappen die niet gekozen zijn wordt dan niet gewacht.
+        Stappen die klaar zijn om te starten krijgen elk een vrije browser, bij voorkeur de browser van hun voorganger.
+        Na een fout start er geen nieuwe stap meer. De lopende stappen worden afgemaakt, daarna volgt StapMislukt.
+    """
+    te_doen = [(naam, functie, na) for naam, functie, budget, na in PIPELINE
+               if naam not in checkpoint.gedaan and (stappen is None or naam in stappen)]
+    overgeslagen = [naam for naam, functie, budget, na in PIPELINE if stappen is not None and naam not in stappen]
+    vrij = list(browsers)
+    gedaan_door = dict()
+    lopend = dict()
+    fout = None
+
+    def voer_uit(naam, functie, browser):
+        browser.vorige_stap = None
+        with meet(naam):
+            functie(browser, slack_client)
+        browser.vorige_stap = naam
+
+    while te_doen or lopend:
+        while fout is None and vrij:
+            klaar = [stap for stap in te_doen
+                     if all(voorganger in checkpoint.gedaan or voorganger in overgeslagen for voorganger in stap[2])]
+            if not klaar:
+                break
+            naam, functie, na = klaar[0]
+            # De browser van de voorganger staat al op de goede pagina
+            voorkeur = [gedaan_door[voorganger] for voorganger in na if gedaan_door.get(voorganger) in vrij]
+            browser = voorkeur[-1] if voorkeur else vrij[0]
+            vrij.remove(browser)
+            te_doen.remove(klaar[0])
+            lopend[executor.submit(voer_uit, naam, functie, browser)] = (naam, browser)
+        if not lopend:
+            if fout is None and te_doen:
+                raise ValueError('stappen wachten op elkaar: {}'.format(', '.join(stap[0] for stap in te_doen)))
+            break
+
+        gereed, _ = wait(lopend, return_when=FIRST_COMPLETED)
+        for future in gereed:
+            naam, browser = lopend.pop(future)
+            vrij.append(browser)
+            oorzaak = future.exception()
+            if oorzaak is not None:
+                error_logger.error('{} mislukt: {!r}'.format(naam, oorzaak))
+                if fout is None:
+                    fout = StapMislukt(naam, browser)
+                    fout.__cause__ = oorzaak
+                continue
+            checkpoint.markeer(naam)
+            gedaan_door[naam] = browser
+    if fout is not None:
+        raise fout
+
+
+def run_script_within_try(slack_client, pool, metrics, checkpoint, opslag=None, stappen=None):
+    """
+        Voert de stappen uit die nog niet gedaan zijn, of alleen de gekozen stappen.
+        Bij een fout wordt de mislukte stap in de checkpoint gezet.
+    """
+    warm = pool.warm()
+    browser = pool.pak()
+    browsers = [browser]
+    browser.wacht_tijden = []
+    browser.vorige_stap = None
+    browser.metrics = metrics
+    browser.opslag = opslag
+    meet = metrics.stap
+
+    stap = 'login'
+    mislukt_in = browser
+    with ThreadPoolExecutor(max_workers=pool.parallel) as executor:
+        # De extra browsers starten terwijl de eerste inlogt
+        hulp = executor.submit(pool.pak_hulp)
+        try:
+            # Gebruik de warme browser of de opgeslagen sessie, of login op osm en de juiste competitie
+            with meet(stap):
+                sessie_pad = os.path.join(settings.directory, 'sessie.json')
+                if not (warm and browser.controleer_sessie()) and not browser.herstel_sessie(sessie_pad):
+                    browser.login(settings.username, settings.password, slack_client)
+                    browser.bewaar_sessie(sessie_pad)
+                # Data lezen gaat via de api, klikken via de browser
+                browser.data = OsmDataClient.van_browser(browser)
+
+            # De extra browsers nemen de sessie over, zonder zelf in te loggen
+            stap = 'extra_browsers'
+            with meet(stap):
+                sessie = browser.sessie()
+                for extra in hulp.result():
+                    try:
+                        extra.zet_sessie(sessie)
+                    except WebDriverException:
+                        error_logger.error('extra browser kon de sessie niet overnemen')
+                        continue
+                    extra.wacht_tijden = []
+                    extra.vorige_stap = None
+                    extra.metrics = metrics
+                    extra.data = browser.data
+                    extra.opslag = opslag
+                    browsers.append(extra)
+
+            # Een fout van de stappen zelf komt als StapMislukt. Een andere fout zit in PIPELINE en heeft geen budget,
+            # een nieuwe poging levert dezelfde fout op.
+            stap = 'pipeline'
+            voer_stappen_uit(browsers, executor, slack_client, checkpoint, meet, stappen)
+            post_to_slack(slack_client, 'Script successfully run')
+            success = True
+        except:
+            fout = sys.exc_info()[1]
+            if isinstance(fout, StapMislukt):
+                stap, mislukt_in = fout.stap, fout.browser
+            else:
+                error_logger.error('{} mislukt: {!r}'.format(stap, fout))
+            # Maak een screenshot en update slack
+            mislukt_in.save_screenshot('screenshot.png')
+            post_to_slack(slack_client, 'Script mislukt bij {}'.format(stap))
+            checkpoint.mislukking(stap)
+            success = False
+    for gebruikt in browsers:
+        for naam, (aantal, totaal, mislukt) in gebruikt.wacht_rapport().items():
+            info_logger.info('wachttijd {}: {} waits, {:.2f}s, {} timeouts'.format(naam, aantal, totaal, mislukt))
+        gebruikt.metrics = None
+        gebruikt.opslag = None
+    pool.geef_terug(success)
     return success
 
 
-def run_script(slack_client=None):
-    post_to_slack(slack_client, 'Script gestart')
+def maak_opslag(run):
+    """
+        Opent de opslag in settings.directory, of geeft None als die uit staat in settings.opslag
+    """
+    opties = dict({'aan': True, 'max_leeftijd_uren': 24}, **getattr(settings, 'opslag', {}))
+    if not opties['aan']:
+        return None
+    return Opslag(os.path.join(settings.directory, 'osm.sqlite'), run,
+                  datetime.timedelta(hours=opties['max_leeftijd_uren']))
+
+
+def run_script(slack_client=None, pool=None, stappen=None, hervat=False):
+    """
+        Een run van de pipeline met pogingen tot hij klaar is of het budget van een stap op is.
+        Met stappen alleen die stappen, dan wordt ook het plan weer bijgewerkt.
+        Met hervat gaat de run verder vanaf de checkpoint van een afgebroken run, anders begint hij opnieuw.
+    """
+    if stappen is None:
+        post_to_slack(slack_client, 'Script gestart')
+    else:
+        stappen = list(stappen) + ['lees_planning']
+        post_to_slack(slack_client, 'Script gestart voor {}'.format(', '.join(stappen)))
+    tijdelijke_pool = pool is None
+    if tijdelijke_pool:
+        pool = DriverPool()
+    metrics = Metrics()
+    checkpoint = Checkpoint(os.path.join(settings.directory, 'checkpoint.json'), hervat=hervat and stappen is None)
+    opslag = maak_opslag(metrics.run)
+    budgetten = dict([(naam, budget) for naam, functie, budget, na in PIPELINE], login=LOGIN_POGINGEN,
+                     extra_browsers=EXTRA_BROWSER_POGINGEN)
     iteration = 1
     finish = False
-    while iteration < 5 and not finish:
-        finish = run_script_within_try(slack_client)
+    while not finish:
+        metrics.poging = iteration
+        finish = run_script_within_try(slack_client, pool, metrics, checkpoint, opslag, stappen)
+        if not finish and checkpoint.budget_op(budgetten):
+            post_to_slack(slack_client, 'Gestopt: {} is {} keer mislukt'.format(
+                checkpoint.mislukt, checkpoint.pogingen[checkpoint.mislukt]))
+            break
         iteration += 1
+    if finish:
+        checkpoint.klaar()
+    if tijdelijke_pool:
+        pool.sluit()
+    if opslag:
+        opslag.sluit()
+    metrics.schrijf(settings.directory, finish)
+    post_to_slack(slack_client, metrics.samenvatting(finish))
+
+
+class RunPlek:
+    """
+        Een plek voor een run in de multi-account modus. Het hoofdproces deelt de plekken uit en houdt bij welk
+        account er een heeft, zodat de plek van een proces dat hard gestopt is weer vrijkomt.
+    """
+
+    def __init__(self, naam, verzoeken, toegekend):
+        self.naam = naam
+        # Queue naar het hoofdproces, en het Event dat het hoofdproces zet als de plek toegekend is
+        self.verzoeken = verzoeken
+        self.toegekend = toegekend
+        self.gevraagd = False
+
+    def acquire(self, block=True, timeout=None):
+        if not self.gevraagd:
+            self.verzoeken.put(('vraag', self.naam))
+            self.gevraagd = True
+        if not self.toegekend.wait(timeout if block else 0):
+            return False
+        self.toegekend.clear()
+        self.gevraagd = False
+        return True
+
+    def release(self):
+        self.verzoeken.put(('klaar', self.naam))
+
+
+def run_account(slack_client, pool, slot, stappen=None, hervat=False):
+    """
+        Een run in de multi-account modus. Wacht op een vrije plek, zodat er niet meer browsers tegelijk draaien
+        dan de host aankan, en sluit de browsers na de run om het geheugen vrij te geven.
+    """
+    if not slot.acquire(timeout=1):
+        info_logger.info('wachten op een vrije plek voor de browsers')
+        slot.acquire()
+    try:
+        run_script(slack_client, pool, stappen, hervat)
+    finally:
+        pool.sluit()
+        slot.release()
 
 
 def init_slack_client(token):
@@ -453,6 +2244,264 @@ def init_slack_client(token):
     return client
 
 
+class Planner:
+    """
+        Plant de runs en verwerkt de commando's uit Slack.
+        Er wordt alles gerund als er meer dan 7 uur verstreken zijn sinds de vorige run van de hele pipeline,
+        of direct na een reset. Daartussen runnen alleen de stappen uit het plan dat de vorige run gemaakt heeft,
+        zodra die nodig zijn. Die tellen niet mee voor het interval, zodat bijv. de sponsor niet overgeslagen wordt.
+    """
+    # Meer dan 7 hele uren, dus 8 uur na de vorige run
+    interval = datetime.timedelta(hours=8)
+
+    def __init__(self, pool, slot=None, vertraging=0):
+        self.pool = pool
+        # Met meerdere accounts: de gedeelde plek waarop gewacht wordt voor een run, en de gespreide eerste start
+        self.slot = slot
+        self.eerste_run = datetime.datetime.now() + datetime.timedelta(seconds=vertraging)
+        # Het plan en de laatste run blijven bewaard bij een herstart
+        self.planning = Plan(os.path.join(settings.directory, 'plan.json'))
+        self.adaptief = dict(PLANNER_OPTIES, **getattr(settings, 'planner', {}))['adaptief']
+        self.run_time = self.planning.laatste_run
+        # Alleen de eerste run na een herstart gaat verder vanaf een checkpoint
+        self.hervat = True
+        self.volledige_run = self.planning.laatste_volledige_run
+        self.run_this = True
+        self.reset = False
+        self.warn = False
+        # Maakt de planner wakker als er een commando binnenkomt
+        self.wakker = asyncio.Event()
+        # De browser pipeline draait in een eigen thread, zodat Slack bereikbaar blijft
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def verwerk(self, mess_res):
+        if 'run' in mess_res:
+            self.run_this = mess_res['run']
+            if not self.run_this:
+                self.warn = True
+        if 'reset' in mess_res:
+            self.reset = mess_res['reset']
+            self.run_this = True
+        self.wakker.set()
+
+    def wachttijd(self):
+        if self.reset:
+            return 0
+        if self.volledige_run is None:
+            return (self.eerste_run - datetime.datetime.now()).total_seconds()
+        volgende = self.volledige_run + self.interval
+        moment = self.planning.volgende() if self.adaptief else None
+        if moment and moment['tijd'] < volgende:
+            volgende = moment['tijd']
+        return (volgende - datetime.datetime.now()).total_seconds()
+
+    def stappen(self):
+        """
+            Geeft de stappen voor de run die nu moet, of None voor de hele pipeline
+        """
+        nu = datetime.datetime.now()
+        if not self.adaptief or self.reset or self.volledige_run is None or self.volledige_run + self.interval <= nu:
+            return None
+        namen = set()
+        for moment in self.planning.momenten:
+            if moment['tijd'] <= nu:
+                namen.update(moment['stappen'])
+        return [naam for naam, functie, budget, na in PIPELINE if naam in namen]
+
+    async def slaap(self, seconden=None):
+        try:
+            await asyncio.wait_for(self.wakker.wait(), seconden)
+        except asyncio.TimeoutError:
+            pass
+        self.wakker.clear()
+
+    async def run(self, stappen=None, hervat=False):
+        loop = asyncio.get_event_loop()
+        start = datetime.datetime.now()
+        if self.slot is None:
+            await loop.run_in_executor(self.executor, run_script, slack_client, self.pool, stappen, hervat)
+        else:
+            await loop.run_in_executor(self.executor, run_account, slack_client, self.pool, self.slot, stappen, hervat)
+        self.run_time = datetime.datetime.now()
+        if stappen is None:
+            self.volledige_run = self.run_time
+        # De run heeft een nieuw plan geschreven. Wat al aan de beurt was is gedaan, ook als dat niet lukte.
+        self.planning.laad()
+        self.planning.verwijder_tot(start)
+        self.planning.laatste_run = self.run_time
+        self.planning.laatste_volledige_run = self.volledige_run
+        self.planning.bewaar()
+
+    async def plan(self):
+        while True:
+            wachttijd = self.wachttijd()
+            if wachttijd > 0:
+                await self.slaap(wachttijd)
+            elif self.run_this:
+                stappen = self.stappen()
+                # Na een reset begint alles opnieuw, ook als er een checkpoint is
+                hervat = self.hervat and not self.reset
+                self.hervat = False
+                self.reset = False
+                await self.run(stappen, hervat)
+            else:
+                if self.warn:
+                    self.warn = False
+                    post_to_slack(slack_client, 'Het is tijd om te trainen!')
+                # Wachten tot er weer gerund mag worden
+                await self.slaap()
+
+
+def lees_websocket(loop, berichten):
+    """
+        Leest in een eigen daemon thread de berichten van de Slack websocket en geeft ze door aan de event loop.
+        De thread blokkeert op de socket, zodat de event loop alleen wakker wordt als er echt iets binnenkomt.
+        Een eigen thread omdat add_reader niet werkt op de ProactorEventLoop van Windows.
+    """
+    while True:
+        try:
+            select.select([slack_client.server.websocket.sock], [], [])
+            events = slack_client.rtm_read()
+        except Exception:
+            # De verbinding is verbroken. Opnieuw opzetten, ook als Slack zelf even niet bereikbaar is.
+            error_logger.error('Slack verbinding verbroken')
+            time.sleep(5)
+            try:
+                slack_client.client = init_slack_client(settings.slack['token']) or slack_client.client
+            except Exception:
+                error_logger.error('Slack verbinding niet hersteld, later opnieuw')
+            continue
+        if events:
+            loop.call_soon_threadsafe(berichten.put_nowait, events)
+
+
+async def lees_slack(planner):
+    """
+        Verwerkt berichten uit Slack zodra ze binnenkomen, ook tijdens een run.
+        Een fout hierin stopt alleen het bericht, nooit de planner.
+    """
+    berichten = asyncio.Queue()
+    threading.Thread(target=lees_websocket, args=(asyncio.get_event_loop(), berichten), name='slack-lezer',
+                     daemon=True).start()
+    while True:
+        events = await berichten.get()
+        try:
+            mess_res = parse_messages(events, planner.run_time)
+            if mess_res:
+                planner.verwerk(mess_res)
+        except Exception:
+            error_logger.error('Slack bericht niet verwerkt: {!r}'.format(events))
+
+
+async def main(pool, slot=None, vertraging=0):
+    planner = Planner(pool, slot, vertraging)
+    taken = [planner.plan()]
+    if slack_client:
+        taken.append(lees_slack(planner))
+    await asyncio.gather(*taken)
+
+
+def maak_slack_client():
+    if not settings.slack:
+        return None
+    client = init_slack_client(settings.slack['token'])
+    if not client:
+        return None
+    # Berichten gaan via een achtergrond thread, zodat de browser niet op Slack hoeft te wachten
+    notifier = SlackNotifier(client, **getattr(settings, 'slack_notifier', {}))
+    atexit.register(notifier.sluit)
+    return notifier
+
+
+def start_account(account, slot, vertraging):
+    """
+        Draait de planner voor een account in een eigen proces. De instellingen van het account vervangen die uit
+        settings, zodat de logs, de sessie en Slack per account gescheiden blijven.
+    """
+    global info_logger, error_logger, slack_client, account_naam, slack_gedeeld
+    account_naam = account['naam']
+    slack_gedeeld = 'slack' not in account
+    for sleutel, waarde in account.items():
+        setattr(settings, sleutel, waarde)
+    os.makedirs(settings.directory, exist_ok=True)
+    info_logger = create_logger(settings.directory, 'info', logging.INFO)
+    error_logger = create_logger(settings.directory, 'error', logging.ERROR)
+    slack_client = maak_slack_client()
+    info_logger.info('account {} start over {:.0f}s'.format(account['naam'], vertraging))
+    pool = DriverPool(**getattr(settings, 'browser_pool', {}))
+    try:
+        asyncio.get_event_loop().run_until_complete(main(pool, slot, vertraging))
+    finally:
+        pool.sluit()
+
+
+def start_accounts(accounts):
+    """
+        Draait elk account uit settings.accounts in een eigen proces. De eerste runs worden gespreid en er lopen
+        nooit meer runs tegelijk dan er browsers passen: max_browsers, of anders het beschikbare geheugen gedeeld
+        door max_geheugen_mb van de browser pool. Een gestopt proces wordt opnieuw gestart.
+    """
+    opties = getattr(settings, 'multi_account', {})
+    pool_opties = dict({'max_geheugen_mb': 1500, 'parallel': 2}, **getattr(settings, 'browser_pool', {}))
+    max_browsers = opties.get('max_browsers')
+    if not max_browsers:
+        geheugen = beschikbaar_geheugen_mb()
+        max_browsers = int(geheugen // pool_opties['max_geheugen_mb']) if geheugen else 1
+    max_browsers = max(1, max_browsers)
+    accounts = [dict(account) for account in accounts]
+    for account in accounts:
+        # Een run gebruikt nooit meer browsers dan er tegelijk mogen
+        account_pool = dict(pool_opties, **account.get('browser_pool', {}))
+        account_pool['parallel'] = max(1, min(account_pool['parallel'], max_browsers))
+        account['browser_pool'] = account_pool
+    runs = max(1, max_browsers // max(account['browser_pool']['parallel'] for account in accounts))
+    info_logger.info('{} accounts, maximaal {} runs tegelijk'.format(len(accounts), runs))
+
+    # Spawn in plaats van fork: elk proces begint met schone settings, loggers en Slack verbinding
+    context = multiprocessing.get_context('spawn')
+    verzoeken = context.Queue()
+    plekken = dict()
+    processen = dict()
+    for nummer, account in enumerate(accounts):
+        account.setdefault('directory', os.path.join(settings.directory, account['naam']))
+        plekken[account['naam']] = RunPlek(account['naam'], verzoeken, context.Event())
+        vertraging = nummer * opties.get('spreiding', 300)
+        proces = context.Process(target=start_account, args=(account, plekken[account['naam']], vertraging),
+                                 name=account['naam'])
+        proces.start()
+        processen[account['naam']] = (account, proces)
+
+    # De plekken worden hier uitgedeeld, niet in de processen. Zo komt de plek van een gestopt proces weer vrij.
+    houders = set()
+    wachtend = collections.deque()
+    controle = time.time() + 60
+    while True:
+        try:
+            soort, naam = verzoeken.get(timeout=max(controle - time.time(), 0))
+            if soort == 'vraag' and naam not in wachtend and naam not in houders:
+                wachtend.append(naam)
+            else:
+                houders.discard(naam)
+        except queue.Empty:
+            pass
+        if time.time() >= controle:
+            controle = time.time() + 60
+            for naam, (account, proces) in processen.items():
+                if not proces.is_alive():
+                    error_logger.error('account {} is gestopt ({}), opnieuw starten'.format(naam, proces.exitcode))
+                    houders.discard(naam)
+                    if naam in wachtend:
+                        wachtend.remove(naam)
+                    plekken[naam].toegekend.clear()
+                    proces = context.Process(target=start_account, args=(account, plekken[naam], 0), name=naam)
+                    proces.start()
+                    processen[naam] = (account, proces)
+        while wachtend and len(houders) < runs:
+            naam = wachtend.popleft()
+            houders.add(naam)
+            plekken[naam].toegekend.set()
+
+
 if __name__ == "__main__":
     # Logger aanmaken
     # Dit kan je oproepen overal door: info_logger.info('Dit is informatie')
@@ -462,45 +2511,14 @@ if __name__ == "__main__":
     info_logger = create_logger(settings.directory, 'info', logging.INFO)
     error_logger = create_logger(settings.directory, 'error', logging.ERROR)
 
-    run_time = datetime.datetime.now()
-    current_time = datetime.datetime.now()
-    diff = current_time - run_time
-
-    if settings.slack:
-        slack_client = init_slack_client(settings.slack['token'])
+    if getattr(settings, 'accounts', []):
+        # Meerdere accounts, elk in een eigen proces met een eigen planner
+        start_accounts(settings.accounts)
     else:
-        slack_client = None
-    run_script(slack_client)
-    run_this = True
-    reset = False
-    warn = False
-    while True:
-        current_time = datetime.datetime.now()
-        diff = current_time - run_time
-        time_passed = (divmod(diff.days * 86400 + diff.seconds, 3600)[0] > 7)
-        if time_passed or reset:
-            if run_this:
-                run_script(slack_client)
-                run_time = datetime.datetime.now()
-                reset = False
-            elif warn:
-                warn = False
-                post_to_slack(slack_client, 'Het is tijd om te trainen!')
-        time.sleep(5)
-        if slack_client:
-            try:
-                # Running the script closes the connection. We might need to set it up agains
-                mess_res = parse_messages(slack_client.rtm_read(), run_time)
-            except:
-                slack_client = init_slack_client(settings.slack['token'])
-                mess_res = parse_messages(slack_client.rtm_read(), run_time)
-        else:
-            mess_res = None
-        if mess_res:
-            if 'run' in mess_res:
-                run_this = mess_res['run']
-                if not run_this:
-                    warn = True
-            if 'reset' in mess_res:
-                reset = mess_res['reset']
-                run_this = True
\ No newline at end of file
+        slack_client = maak_slack_client()
+        # Een warme browser die tussen de runs blijft bestaan
+        pool = DriverPool(**getattr(settings, 'browser_pool', {}))
+        try:
+            asyncio.get_event_loop().run_until_complete(main(pool))
+        finally:
+            pool.sluit()
@@ -8,4 +8,65 @@ slack = {
     'token': ''
 }
 driver = webdriver.PhantomJS
-# driver_path alleen als die niet in PATH zit
\ No newline at end of file
+# driver_path alleen als die niet in PATH zit
+
+# Optioneel: timeouts (seconden) per stap voor het wachten op de pagina, bijv. {'login': 30}
+wait_timeouts = {}
+
+# Optioneel: wanneer de browser tussen runs vervangen wordt.
+# 'parallel' is het aantal browsers waarover de onafhankelijke stappen verdeeld worden, 1 doet alles na elkaar.
+browser_pool = {
+    'max_runs': 20,
+    'max_geheugen_mb': 1500,
+    'parallel': 2
+}
+
+# Optioneel: berichten die binnen 'venster' seconden komen worden samen naar Slack gestuurd
+slack_notifier = {
+    'venster': 2,
+    'max_wachtrij': 100
+}
+
+# Optioneel: schrijf na elke run de metrics ook als Prometheus tekstbestand, bijv. voor de node_exporter textfile collector
+metrics = {
+    'prometheus': ''
+}
+
+# Lichte browser: headless, zonder afbeeldingen, media, fonts en trackers. Zet op False om mee te kijken bij het debuggen.
+lichte_driver = True
+# Optioneel: pas het profiel van de lichte browser aan, bijv. {'window_size': (1920, 1080), 'flags': ['--no-sandbox']}
+driver_opties = {}
+
+# Lees spelers, scheidsrechter, rente en sponsors via de JSON api in plaats van de pagina's.
+# Zet 'aan' op False om alles via de browser te doen; de endpoints zijn aan te passen, zie API in main.py
+api = {
+    'aan': True
+}
+
+# Optioneel: meerdere accounts, elk in een eigen proces met een eigen planner, logs, sessie en Slack.
+# Elk account vervangt de instellingen hierboven, bijv.
+#     {'naam': 'club2', 'username': '', 'password': '', 'slack': {'channel': '', 'token': ''}}
+# Zonder 'directory' komen de logs en de sessie in een map met de naam van het account binnen directory.
+# Berichten in Slack beginnen met [naam]. Een commando gaat naar een account met de naam ervoor, bijv. 'club2 run';
+# een account zonder eigen 'slack' deelt die van hierboven en reageert alleen op commando's met zijn naam.
+accounts = []
+# Met meerdere accounts: de eerste runs 'spreiding' seconden na elkaar, en hooguit 'max_browsers' browsers tegelijk.
+# Zonder max_browsers wordt dat berekend uit het vrije geheugen en max_geheugen_mb van browser_pool.
+# Een run gebruikt dan ook nooit meer dan max_browsers browsers, ook als parallel in browser_pool hoger staat.
+multi_account = {
+    'spreiding': 300,
+    'max_browsers': None
+}
+
+# Optioneel: toestand tussen runs in directory/osm.sqlite. Specialisten en speelstijl worden niet opnieuw gezet als
+# ze hetzelfde zouden worden als de vorige keer, tot die vorige keer ouder is dan max_leeftijd_uren.
+opslag = {
+    'aan': True,
+    'max_leeftijd_uren': 24
+}
+
+# Optioneel: plan de runs op de timers van de trainingen, de aftrap en de rente in plaats van elke 8 uur alles.
+# Zie PLANNER_OPTIES in main.py voor de marges, bijv. {'adaptief': False} voor het oude gedrag.
+planner = {
+    'adaptief': True
+}
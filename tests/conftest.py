@@ -0,0 +1,16 @@
+"""
+    Gedeelde opzet van de tests. main leest settings bij het importeren; zonder eigen settings.py gebruiken de tests
+    settings_example.py. De nep-site en de benchmark staan in benchmarks/.
+"""
+import importlib
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+try:
+    import settings  # noqa: F401
+except ImportError:
+    sys.modules['settings'] = importlib.import_module('settings_example')
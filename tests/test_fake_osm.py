@@ -0,0 +1,79 @@
+"""
+    Draait de hele pipeline tegen de nep-site uit benchmarks/fake_osm.py en controleert de toestand van de site
+    daarna. Wordt overgeslagen als settings.driver geen browser kan starten.
+"""
+import json
+import os
+import shutil
+import tempfile
+import urllib.request
+
+import pytest
+
+import bench_pipeline
+import fake_osm
+import main
+import settings
+
+
+@pytest.fixture(scope='module')
+def pool():
+    server, base_url = fake_osm.start()
+    oud = main.BASE_URL, getattr(settings, 'api', None), settings.directory
+    main.BASE_URL = base_url
+    settings.api = {'base_url': base_url + 'api/'}
+    settings.directory = tempfile.mkdtemp()
+    pool = main.DriverPool(parallel=2)
+    try:
+        try:
+            pool.pak()
+        except Exception as fout:
+            pytest.skip('geen browser te starten: {!r}'.format(fout))
+        yield pool
+    finally:
+        pool.sluit()
+        server.shutdown()
+        shutil.rmtree(settings.directory)
+        main.BASE_URL, settings.api, settings.directory = oud
+
+
+def toestand():
+    with urllib.request.urlopen(main.BASE_URL + 'fake/toestand') as antwoord:
+        return json.loads(antwoord.read().decode())
+
+
+@pytest.mark.parametrize('api', [{}, {'aan': False}], ids=['api', 'zonder_api'])
+def test_pipeline(pool, monkeypatch, api):
+    # Zonder api leest de pipeline alles van de pagina's. De controle gebruikt daarna wel de api.
+    monkeypatch.setattr(settings, 'api', dict(settings.api, **api))
+    bench_pipeline.begintoestand(pool)
+    metrics = main.Metrics()
+    checkpoint = main.Checkpoint(os.path.join(settings.directory, 'checkpoint.json'))
+    assert main.run_script_within_try(None, pool, metrics, checkpoint), checkpoint.mislukt
+    monkeypatch.undo()
+
+    browser = pool.pak()
+    browser.go_to_url('ControlCentre')
+    data = toestand()
+    beste = max(main.OsmDataClient.van_browser(browser).sponsor_prijzen())
+    assert all(sponsor and sponsor.endswith(' {}K'.format(beste)) for sponsor in data['sponsors'])
+    spelers = main.OsmDataClient.van_browser(browser).spelers()
+    assert data['specialisten'] == main.kies_specialisten(spelers)
+    assert data['bank']
+    assert all(data['training'])
+    assert not data['toast']
+    assert not data['resultaat']
+
+
+def test_specialisten_zonder_api(pool, monkeypatch):
+    # Zonder api komt de selectie uit de spelerskeuze. De tweede keer staat alles al goed en moet de keuze dicht.
+    monkeypatch.setattr(settings, 'api', {'aan': False})
+    bench_pipeline.begintoestand(pool)
+    browser = pool.pak()
+    browser.login('test', 'test', None)
+    browser.data = None
+    browser.zet_specialist_goed()
+    gezet = toestand()['specialisten']
+    assert all(gezet)
+    browser.zet_specialist_goed()
+    assert toestand()['specialisten'] == gezet
@@ -0,0 +1,219 @@
+"""
+    Tests van de functies in main die zonder browser werken
+"""
+import datetime
+import threading
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+import settings
+
+
+def test_parse_table():
+    html = """
+        <table>
+            <thead><tr><th>Naam</th><th>Aan</th><th>Aan</th><th></th></tr></thead>
+            <tbody>
+                <tr><td>Piet   Jansen</td><td>50</td><td>40</td><td></td></tr>
+                <tr><td>Kees</td><td>60</td></tr>
+            </tbody>
+        </table>
+    """
+    tabel = main.parse_table(html)
+    assert list(tabel.columns) == ['Naam', 'Aan', 'Aan.1', 'Unnamed: 3']
+    assert list(tabel.index) == [1, 2]
+    assert list(tabel['Naam']) == ['Piet Jansen', 'Kees']
+    assert tabel.loc[1, 'Aan.1'] == '40'
+    assert np.isnan(tabel.loc[2, 'Aan.1'])
+
+
+def test_kies_specialisten():
+    spelers = pd.DataFrame([['A', 80, 10, 20], ['B', 10, 90, 30], ['C', 70, 20, 35], ['D', 60, 60, 20]],
+                           columns=['Aanvallers', 'Aan', 'Ver', 'Lft'])
+    # A is ook de beste voor de corners, maar is al gekozen voor de vrije trappen
+    assert main.kies_specialisten(spelers) == ['B', 'C', 'A', 'D']
+
+
+@pytest.mark.parametrize('tekst, seconden', [
+    ('Bezig: Piet Jansen 01:59:30', 7170),
+    ('12:05', 725),
+    ('Trainen 250K', None),
+])
+def test_parse_resterend(tekst, seconden):
+    assert main.parse_resterend(tekst) == seconden
+
+
+def test_maak_plan(monkeypatch):
+    monkeypatch.setattr(settings, 'planner', {}, raising=False)
+    nu = datetime.datetime(2020, 1, 1, 12)
+    aftrap = nu + datetime.timedelta(hours=5)
+    rente_vrij = nu + datetime.timedelta(hours=1)
+    momenten = main.maak_plan([0, 3600, 3700, 20000], aftrap, rente_vrij, nu)
+
+    assert [moment['reden'] for moment in momenten] == ['rente', 'training', 'aftrap', 'training']
+    # Slot 1 en 2 zijn binnen het samenvoeg venster klaar, dan in een run als de laatste klaar is
+    assert momenten[1]['tijd'] == nu + datetime.timedelta(seconds=3700 + 60)
+    assert momenten[1]['stappen'] == ['transfer_geld_af', 'rond_training_af', 'train_1', 'train_2',
+                                      'transfer_geld_op']
+    assert momenten[2]['tijd'] == aftrap - datetime.timedelta(seconds=1800)
+    assert momenten[3]['stappen'][2:-1] == ['train_3']
+
+
+def test_maak_plan_zonder_timers(monkeypatch):
+    monkeypatch.setattr(settings, 'planner', {}, raising=False)
+    nu = datetime.datetime(2020, 1, 1, 12)
+    # Een aftrap en rente in het verleden leveren geen moment op
+    assert main.maak_plan([0, None], nu - datetime.timedelta(hours=1), nu, nu) == []
+
+
+def test_vat_samen():
+    assert main.vat_samen(['Speler getraind', 'Geld op de bank', 'Speler getraind'], 2) == \
+        'Speler getraind (2x)\nGeld op de bank\n2 berichten overgeslagen'
+
+
+class SlackStub:
+    """
+        Neemt de plaats in van de SlackClient: onthoudt de verstuurde teksten en geeft de antwoorden van de lijst,
+        een Exception in de lijst wordt gegooid
+    """
+
+    def __init__(self, antwoorden=None):
+        self.antwoorden = list(antwoorden or [])
+        self.teksten = []
+        self.bezig = threading.Event()
+        self.door = threading.Event()
+        self.door.set()
+
+    def api_call(self, methode, timeout, text, **kwargs):
+        self.teksten.append(text)
+        self.bezig.set()
+        self.door.wait(10)
+        antwoord = self.antwoorden.pop(0) if self.antwoorden else {'ok': True}
+        if isinstance(antwoord, Exception):
+            raise antwoord
+        return antwoord
+
+
+def test_slack_notifier_voegt_samen():
+    client = SlackStub()
+    notifier = main.SlackNotifier(client, venster=0.5)
+    for bericht in ['Speler getraind', 'Geld op de bank', 'Speler getraind']:
+        notifier.post(bericht)
+    notifier.sluit()
+    assert client.teksten == ['Speler getraind (2x)\nGeld op de bank']
+
+
+def test_slack_notifier_probeert_opnieuw(monkeypatch):
+    slapen = []
+    monkeypatch.setattr(main.time, 'sleep', slapen.append)
+    client = SlackStub([{'ok': False}, Exception('verbinding weg'), {'ok': True}])
+    notifier = main.SlackNotifier(client, pogingen=3)
+    assert notifier.verstuur('Geld op de bank')
+    assert client.teksten == ['Geld op de bank'] * 3
+    # Exponentiele backoff tussen de pogingen
+    assert slapen == [1, 2]
+
+    slapen.clear()
+    client.antwoorden = [{'ok': False}] * 3
+    assert not notifier.verstuur('Geld op de bank')
+    assert slapen == [1, 2]
+    notifier.sluit()
+
+
+def test_slack_notifier_telt_overgeslagen():
+    client = SlackStub()
+    client.door.clear()
+    notifier = main.SlackNotifier(client, venster=0, max_wachtrij=1)
+    notifier.post('Speler getraind')
+    # De thread staat in api_call, de wachtrij heeft plek voor een bericht
+    assert client.bezig.wait(10)
+    for bericht in ['Geld op de bank', 'Sponsor gekozen', 'Bonus opgehaald']:
+        notifier.post(bericht)
+    client.door.set()
+    notifier.sluit()
+    assert client.teksten == ['Speler getraind', 'Geld op de bank\n2 berichten overgeslagen']
+
+
+class KlikDriver:
+    def __init__(self):
+        self.klikken = []
+
+    def execute_script(self, script, pijl, aantal):
+        self.klikken.append((pijl, aantal))
+
+
+@pytest.mark.parametrize('cyclisch, van, naar, klikken', [
+    (True, 0, 5, [('vorige', 1)]),
+    (True, 1, 3, [('volgende', 2)]),
+    (True, 2, 2, []),
+    (False, 5, 1, [('vorige', 4)]),
+    (False, 0, 3, [('volgende', 3)]),
+])
+def test_carrousel_naar_index(cyclisch, van, naar, klikken):
+    driver = KlikDriver()
+    carrousel = main.Carrousel(driver, None, lambda: None, lambda: 'volgende', lambda: 'vorige',
+                               volgorde=list(range(6)), cyclisch=cyclisch)
+    carrousel.naar_index(van, naar)
+    assert driver.klikken == klikken
+
+
+def test_carrousel_zonder_vorige():
+    driver = KlikDriver()
+    carrousel = main.Carrousel(driver, None, lambda: None, lambda: 'volgende', volgorde=list(range(6)))
+    carrousel.naar_index(0, 5)
+    assert driver.klikken == [('volgende', 5)]
+
+    # Een carrousel die niet rond gaat kan zonder vorige pijl niet terug
+    carrousel = main.Carrousel(driver, None, lambda: None, lambda: 'volgende', volgorde=list(range(6)),
+                               cyclisch=False)
+    with pytest.raises(ValueError):
+        carrousel.naar_index(3, 1)
+
+
+class NepCarrousel:
+    """
+        Een carrousel die niet rond gaat, met pijlen die een stap verder of terug klikken
+    """
+
+    def __init__(self, opties, positie):
+        self.opties = opties
+        self.positie = positie
+
+    def optie(self):
+        return self.opties[self.positie]
+
+    def pijl(self, richting):
+        pijl = mock.Mock()
+        pijl.click.side_effect = lambda: setattr(
+            self, 'positie', min(max(self.positie + richting, 0), len(self.opties) - 1))
+        return pijl
+
+    def wacht(self, conditie, omschrijving, stap='default'):
+        return conditie(self)
+
+
+@pytest.mark.parametrize('positie, doel', [(1, 'D'), (3, 'A')])
+def test_carrousel_stap_voor_stap(positie, doel):
+    nep = NepCarrousel(['A', 'B', 'C', 'D'], positie)
+    # De volgorde klopt niet meer, dan stap voor stap in beide richtingen
+    carrousel = main.Carrousel(nep, None, nep.optie, lambda: nep.pijl(1), lambda: nep.pijl(-1),
+                               volgorde=['X'], cyclisch=False)
+    assert carrousel.ga_naar(doel)
+    assert nep.optie() == doel
+
+
+def test_opslag_spelers_met_dezelfde_naam(tmp_path):
+    opslag = main.Opslag(str(tmp_path / 'osm.sqlite'), 'run1')
+    overzicht = pd.DataFrame([['Piet Jansen', 'A', 20, 50, 40], ['Piet Jansen', 'A', 20, 60, 30],
+                              ['Kees', 'V', 25, 10, 70]], columns=['Aanvallers', 'positie', 'Lft', 'Aan', 'Ver'])
+    opslag.bewaar_spelers(overzicht)
+    # Een tweede keer in dezelfde run vervangt de rijen
+    opslag.bewaar_spelers(overzicht)
+    geschiedenis = opslag.geschiedenis('Piet Jansen')
+    opslag.sluit()
+    assert list(geschiedenis['volgnummer']) == [0, 1]
+    assert list(geschiedenis['aan']) == [50, 60]